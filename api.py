@@ -1,11 +1,57 @@
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, jsonify, request, render_template, Response, stream_with_context, g
+import codecs
+import os
+import queue
 import re
 import wg_mgmt
+import wg_inventory
+import wg_stats
+import wg_import
+import wg_health
 import gost_mgmt
-import subprocess
+import gost_config
+import gost_pool
+import gost_plan
+import listener_store
+import gost_supervisor
 import logging
+import time
+import metrics
+import profiling
+import jobs
+import events
 
 app = Flask(__name__)
+if profiling.enabled:
+    # ?_profile=1 on any route; the event stream never finishes, so it cannot be profiled
+    app.wsgi_app = profiling.ProfilerMiddleware(app.wsgi_app, skip_paths=('/api/events',))
+
+# Routes that change what /api/events reports (several of them are GETs)
+STATE_CHANGING_ENDPOINTS = frozenset({
+    'add_wireguard_interface', 'modify_config', 'start_config', 'stop_config', 'api_remove_wireguard_config',
+    'import_wireguard_archive', 'remove_config', 'add_config', 'import_gost_configs', 'update_gost_config',
+    'start_gost', 'stop_gost', 'gost_shard_start', 'gost_shard_stop', 'replace_interface_listeners',
+    'set_interface_pool',
+})
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if profiling.enabled:
+        profiling.start_request(request.method, request.path)
+
+@app.after_request
+def record_request_latency(response):
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.snapshot.histogram.observe(route, request.method, time.perf_counter() - started)
+        if profiling.enabled:
+            profiling.finish_request(route, response.status_code)
+    if request.endpoint in STATE_CHANGING_ENDPOINTS:
+        # Push the change to this worker's open dashboards without waiting for the next poll
+        events.hub.notify()
+    return response
 
 def validate_interface_name(interface_name):
     # Check if 'interface' is specified
@@ -25,11 +71,60 @@ def validate_interface_name(interface_name):
     # If validation passes, return None to indicate success
     return None
 
+def wants_job():
+    # ?async=1 queues the operation as a background job and returns its id straight away
+    return request.args.get('async', 'false').lower() in ('1', 'true', 'yes')
+
+def queue_job(kind, target, func, **kwargs):
+    job_id = jobs.submit(kind, target, func, **kwargs)
+    return jsonify({"status": "success", "message": f"{kind} queued for {target}", "job_id": job_id}), 202
+
+def wireguard_job(operation, event=None):
+    # Job wrapper for wg_mgmt calls that keeps the inventory, listeners and /api/events current
+    def run(interface_name, **kwargs):
+        result = operation(interface_name, **kwargs)
+        wg_inventory.inventory.invalidate()
+        if event and result.get("status") in ('success', 'warning'):
+            cascade_interface_event(interface_name, event)
+        events.hub.notify()
+        return result
+    return run
+
+def cascade_interface_event(interface_name, event):
+    # Interface went 'down' or came back 'up': move only its listeners, then push them to GOST
+    try:
+        if event == 'down':
+            moved = wg_mgmt.fail_over_listeners(interface_name)
+        elif event == 'up':
+            moved = wg_mgmt.restore_listeners(interface_name)
+        else:
+            moved = 0
+    except Exception as e:
+        logging.error(f"Failed to move listeners for {interface_name} ({event}): {e}")
+        return 0
+    if moved:
+        reload_gost_listeners()
+    return moved
+
+def reload_gost_listeners():
+    # In config/pool mode push listener changes to the running GOST; in command mode
+    # refresh the launch plan and gost_command.txt for the next start
+    try:
+        if gost_config.gost_mode not in ('config', 'pool'):
+            gost_plan.plan.current()
+            return None
+        if gost_config.gost_mode == 'pool':
+            return gost_pool.sync_shards()
+        return gost_config.sync_config()
+    except Exception as e:
+        logging.error(f"Failed to reload GOST listeners: {e}")
+        return {"status": "error", "message": str(e)}
+
 # WireGuard Interfaces
 @app.route('/api/wireguard/interfaces', methods=['GET'])
 def get_all_wireguard_interface_names():
     try:
-        interface_names = wg_mgmt.get_wireguard_interface_names()
+        interface_names = wg_inventory.inventory.config_names()
         return jsonify({"status": "success", "data": interface_names})
     except Exception as e:
         # Log the exception
@@ -39,12 +134,46 @@ def get_all_wireguard_interface_names():
 #up wireguard interfaces
 @app.route('/api/wireguard/get_active_interfaces', methods=['GET'])
 def api_get_active_wireguard_interfaces():
-    interfaces = wg_mgmt.get_active_wireguard_interfaces()
+    interfaces = wg_inventory.inventory.active_interfaces()
     if interfaces is None:
         return jsonify({"status": "error", "message": "Could not retrieve WireGuard interfaces"}), 500
     return jsonify({"status": "success", "data": interfaces})
 
 
+#configured interfaces and their up/down state in one call
+@app.route('/api/wireguard/inventory', methods=['GET'])
+def api_get_wireguard_inventory():
+    try:
+        return jsonify({"status": "success", "data": wg_inventory.inventory.snapshot()})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+#per-interface and per-peer handshake/transfer stats with rates
+@app.route('/api/wireguard/stats', methods=['GET'])
+def api_get_wireguard_stats():
+    interface_name = request.args.get('interface')
+    if interface_name:
+        validation_result = validate_interface_name(interface_name)
+        if validation_result is not None:
+            return jsonify(validation_result[0]), validation_result[1]
+    try:
+        window = float(request.args.get('window', wg_stats.default_window))
+    except ValueError:
+        return jsonify({"status": "error", "message": "window must be a number of seconds"}), 400
+
+    try:
+        stats = wg_stats.collector.stats(window)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+    if interface_name:
+        if interface_name not in stats["interfaces"]:
+            return jsonify({"status": "error", "message": f"{interface_name} is not up"}), 404
+        stats["interfaces"] = {interface_name: stats["interfaces"][interface_name]}
+    return jsonify({"status": "success", "data": stats})
+
+
 #Add wireguard
 @app.route('/api/wireguard/add', methods=['POST'])
 def add_wireguard_interface():
@@ -55,12 +184,13 @@ def add_wireguard_interface():
         return jsonify({"status": "error", "message": "No configuration provided."}), 400
 
     result = wg_mgmt.add_wireguard_config(wg_config)
+    wg_inventory.inventory.invalidate()
 
     if result["status"] == "success":
         return jsonify({"status": "success", "message": "WireGuard interface added successfully."}), 201
     else:
         print(result)
-        return jsonify({"status": "error", "message": "Failed to add WireGuard interface."}), 500
+        return jsonify({"status": "error", "message": f"Failed to add WireGuard interface: {result['message']}"}), 500
 
 @app.route('/api/wireguard/get_config', methods=['GET'])
 def get_config():
@@ -80,17 +210,42 @@ def get_config():
 def modify_config():
     interface_name = request.form.get('interface')
     config = request.form.get('config')
+    if wants_job():
+        validation_result = validate_interface_name(interface_name)
+        if validation_result is not None:
+            return jsonify(validation_result[0]), validation_result[1]
+        return queue_job('wireguard_modify', interface_name,
+                         wireguard_job(lambda name, timeout: wg_mgmt.save_config(name, config, timeout=timeout)),
+                         timeout=jobs.default_timeout)
     try:
-        wg_mgmt.save_config(interface_name, config)
-        return jsonify(({"status" : "success", "message": "WireGuard Config modified sucessfully"}))
+        result = wg_mgmt.save_config(interface_name, config)
+        wg_inventory.inventory.invalidate()
+        if result["status"] == "error" and result["mode"] is None:
+            return jsonify({"status": "error", "message": f"Invalid configuration: {result['error_message']}"}), 400
+        if result["status"] == "error":
+            return jsonify({"status": "error", "message": f"Config saved but {interface_name} failed to come up: {result.get('error_message', '')}"})
+        if result["mode"] == "live":
+            return jsonify({"status": "success", "message": "WireGuard Config modified sucessfully and applied without restart", "mode": "live"})
+        return jsonify(({"status" : "success", "message": "WireGuard Config modified sucessfully", "mode": "restart"}))
     except Exception as e:
         return jsonify(({"status" : "error", "message": f"Exception {e}"}))
 
 @app.route('/api/wireguard/start_config', methods=['GET'])
 def start_config():
     interface_name = request.args.get('interface')
+    if wants_job():
+        validation_result = validate_interface_name(interface_name)
+        if validation_result is not None:
+            return jsonify(validation_result[0]), validation_result[1]
+        return queue_job('wireguard_up', interface_name, wireguard_job(wg_mgmt.bring_interface_up, 'up'),
+                         timeout=jobs.default_timeout)
     try:
-        result = wg_mgmt.bring_interface_up(interface_name)
+        # Same per-interface lock as queued jobs, so this never races a batch on the interface
+        with jobs.target_lock(interface_name):
+            result = wg_mgmt.bring_interface_up(interface_name)
+            wg_inventory.inventory.invalidate()
+            if result['status'] == 'success':
+                cascade_interface_event(interface_name, 'up')
         if result['status'] == 'success':
             return jsonify({"status": "success", "message": f"{interface_name} brought up successfully"})
         else:
@@ -111,9 +266,17 @@ def stop_config():
     if validation_result is not None:
         return jsonify(validation_result[0]), validation_result[1]
 
+    if wants_job():
+        return queue_job('wireguard_down', interface_name, wireguard_job(wg_mgmt.bring_interface_down, 'down'),
+                         timeout=jobs.default_timeout)
+
     try:
-        result = wg_mgmt.bring_interface_down(interface_name)
-        print(result)
+        with jobs.target_lock(interface_name):
+            result = wg_mgmt.bring_interface_down(interface_name)
+            wg_inventory.inventory.invalidate()
+            print(result)
+            if result['status'] in ['success', 'warning']:
+                cascade_interface_event(interface_name, 'down')
         if result['status'] in ['success', 'warning']:
             return jsonify({
                 "status": result['status'],
@@ -144,18 +307,208 @@ def api_remove_wireguard_config():
     
     if not re.match(r'^wg\d+$', interface_name):
         return jsonify({"status": "error", "message": "Invalid interface format. Expected format is 'wgX' where X is a number."}), 400
+
+    if wants_job():
+        def remove(name):
+            if not wg_mgmt.remove_wireguard_config(name):
+                return {"status": "error", "error_message": f"Failed to remove WireGuard interface '{name}'."}
+            reload_gost_listeners()
+            return {"status": "success", "message": f"WireGuard interface '{name}' removed successfully."}
+        return queue_job('wireguard_remove', interface_name, wireguard_job(remove))
     
     success = wg_mgmt.remove_wireguard_config(interface_name)
+    wg_inventory.inventory.invalidate()
     
     if success:
+        reload_gost_listeners()
         return jsonify({"status": "success", "message": f"WireGuard interface '{interface_name}' removed successfully."})
     else:
         return jsonify({"status": "error", "message": f"Failed to remove WireGuard interface '{interface_name}'."}), 500
 
+WIREGUARD_BATCH_ACTIONS = ('up', 'down', 'restart')
+
+@app.route('/api/wireguard/batch', methods=['POST'])
+def wireguard_batch():
+    # Accept JSON {"interfaces": [...], "action": "up"} or form fields
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {"interfaces": request.form.getlist('interfaces'), "action": request.form.get('action')}
+    if not isinstance(data, dict):
+        return jsonify({"status": "error", "message": "Request body must be a JSON object"}), 400
+    interfaces = data.get("interfaces") or []
+    action = data.get("action")
+
+    if action not in WIREGUARD_BATCH_ACTIONS:
+        return jsonify({"status": "error", "message": f"Action must be one of: {', '.join(WIREGUARD_BATCH_ACTIONS)}"}), 400
+    if not isinstance(interfaces, list) or not interfaces:
+        return jsonify({"status": "error", "message": "No interfaces specified"}), 400
+    if not all(isinstance(interface_name, str) for interface_name in interfaces):
+        return jsonify({"status": "error", "message": "Interface names must be strings"}), 400
+    for interface_name in interfaces:
+        validation_result = validate_interface_name(interface_name)
+        if validation_result is not None:
+            return jsonify(validation_result[0]), validation_result[1]
+
+    # A restart ends with the interface up again, so its listeners stay where they are
+    cascade = {'up': 'up', 'down': 'down'}.get(action)
+    run = wireguard_job(lambda interface_name, timeout: wg_mgmt.wireguard_action(interface_name, action, timeout), cascade)
+    job_id = jobs.submit_batch(f"wireguard_{action}", interfaces, run, timeout=jobs.default_timeout)
+    return jsonify({"status": "success", "message": f"Batch {action} queued", "job_id": job_id}), 202
+
+@app.route('/api/wireguard/batch/<job_id>', methods=['GET'])
+def wireguard_batch_status(job_id):
+    job = jobs.load_job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify({"status": "success", "data": jobs.summarize(job)})
+
+@app.route('/api/wireguard/import', methods=['POST'])
+def import_wireguard_archive():
+    # Accept a multipart "archive" upload or the raw archive as the request body
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('archive')
+        if upload is None:
+            return jsonify({"status": "error", "message": "No archive uploaded."}), 400
+        archive = upload.stream
+    else:
+        try:
+            archive = wg_import.spool(request.stream)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 413
+
+    bring_up = request.args.get('up', 'false').lower() in ('1', 'true', 'yes')
+    try:
+        parallelism = int(request.args.get('parallelism', wg_import.max_parallel))
+    except ValueError:
+        return jsonify({"status": "error", "message": "parallelism must be a number"}), 400
+
+    try:
+        report = wg_import.import_archive(archive, bring_up=bring_up, parallelism=parallelism)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+    finally:
+        archive.close()
+        wg_inventory.inventory.invalidate()
+
+    added = sum(1 for entry in report if entry["status"] == "success")
+    if not report:
+        return jsonify({"status": "error", "message": "Archive contains no .conf files.", "files": []}), 400
+    if added == len(report):
+        status, code = "success", 201
+    elif added:
+        status, code = "partial", 207
+    else:
+        status, code = "error", 400
+    return jsonify({"status": status, "added": added, "failed": len(report) - added, "files": report}), code
+
+@app.route('/api/wireguard/<interface_name>/listeners', methods=['GET'])
+def interface_listeners(interface_name):
+    validation_result = validate_interface_name(interface_name)
+    if validation_result is not None:
+        return jsonify(validation_result[0]), validation_result[1]
+    return jsonify({
+        "status": "success",
+        "data": gost_mgmt.store.rows_for_interface(interface_name),
+        "standby": wg_mgmt.standby_interface(interface_name)
+    })
+
+@app.route('/api/wireguard/<interface_name>/standby', methods=['PUT'])
+def set_interface_standby(interface_name):
+    # {"standby": "wg7"} makes wg7 take over this interface's listeners while it is down; null clears it
+    validation_result = validate_interface_name(interface_name)
+    if validation_result is not None:
+        return jsonify(validation_result[0]), validation_result[1]
+    data = request.get_json(silent=True) or request.form
+    if not isinstance(data, dict):
+        return jsonify({"status": "error", "message": "Request body must be a JSON object"}), 400
+    standby = data.get("standby") or None
+    if standby is not None and (standby == interface_name or standby not in gost_mgmt.get_network_interfaces()):
+        return jsonify({"status": "error", "message": "Standby must be another existing network interface."}), 400
+    wg_mgmt.set_standby_interface(interface_name, standby)
+    return jsonify({"status": "success", "message": f"Standby for {interface_name} set to {standby}", "standby": standby})
+
+@app.route('/api/wireguard/<interface_name>/replace', methods=['POST'])
+def replace_interface_listeners(interface_name):
+    # Move every listener on interface_name to another interface
+    validation_result = validate_interface_name(interface_name)
+    if validation_result is not None:
+        return jsonify(validation_result[0]), validation_result[1]
+    data = request.get_json(silent=True) or request.form
+    if not isinstance(data, dict):
+        return jsonify({"status": "error", "message": "Request body must be a JSON object"}), 400
+    new_interface = data.get("interface")
+    if not new_interface or new_interface not in gost_mgmt.get_network_interfaces():
+        return jsonify({"status": "error", "message": "Invalid network interface."}), 400
+    moved = wg_mgmt.reassign_listeners(interface_name, new_interface)
+    if moved:
+        reload_gost_listeners()
+    return jsonify({"status": "success", "message": f"Moved {moved} listeners from {interface_name} to {new_interface}", "moved": moved})
+
+@app.route('/api/wireguard/<interface_name>/pool', methods=['PUT'])
+def set_interface_pool(interface_name):
+    # {"pool": "eu"} lets listeners of pool "eu" fail over to this interface; null takes it out
+    validation_result = validate_interface_name(interface_name)
+    if validation_result is not None:
+        return jsonify(validation_result[0]), validation_result[1]
+    data = request.get_json(silent=True) or request.form
+    if not isinstance(data, dict):
+        return jsonify({"status": "error", "message": "Request body must be a JSON object"}), 400
+    try:
+        pool = gost_mgmt.validate_pool_name(data.get("pool")) or None
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    wg_health.set_interface_pool(interface_name, pool)
+    return jsonify({"status": "success", "message": f"Pool for {interface_name} set to {pool}", "pool": pool})
+
+@app.route('/api/wireguard/pools', methods=['GET'])
+def get_interface_pools():
+    health = wg_health.read_state()["interfaces"]
+    pools = {
+        pool: [{"interface": name, "healthy": health.get(name, {}).get("healthy")} for name in members]
+        for pool, members in wg_health.interface_pools().items()
+    }
+    return jsonify({"status": "success", "data": pools})
+
+@app.route('/api/wireguard/health', methods=['GET'])
+def get_interface_health():
+    # Written by the wg_health.py checker; interfaces it has not seen yet are absent
+    state = wg_health.read_state()
+    return jsonify({"status": "success", "updated": state["updated"], "data": state["interfaces"]})
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    try:
+        limit = min(int(request.args.get('limit', 50)), 500)
+    except ValueError:
+        return jsonify({"status": "error", "message": "limit must be a number"}), 400
+    found = jobs.list_jobs(status=request.args.get('status'), kind=request.args.get('kind'), limit=limit)
+    return jsonify({"status": "success", "data": [jobs.summarize(job) for job in found]})
+
+@app.route('/api/debug/slow_requests', methods=['GET'])
+def list_slow_requests():
+    if not profiling.enabled:
+        return jsonify({"status": "error", "message": "Profiling is disabled, start with PROFILING=1"}), 404
+    try:
+        limit = min(int(request.args.get('limit', 20)), profiling.max_slow_requests)
+    except ValueError:
+        return jsonify({"status": "error", "message": "limit must be a number"}), 400
+    # Only the requests this worker served; every gunicorn worker keeps its own list
+    return jsonify({"status": "success", "worker": os.getpid(), "threshold_ms": profiling.slow_threshold * 1000,
+                    "data": profiling.recent_slow_requests(limit)})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.load_job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify({"status": "success", "data": jobs.summarize(job)})
+
 @app.route('/api/wireguard/save_file', methods=['GET'])
 def save_active_interfaces_to_file():
     try:
-        active_interfaces = wg_mgmt.get_active_wireguard_interfaces()
+        active_interfaces = wg_inventory.inventory.active_interfaces()
         filename = 'active_interfaces.txt'
 
         with open(filename, 'w') as file:
@@ -179,10 +532,12 @@ def save_active_interfaces_to_file():
 @app.route('/api/gost/get_config', methods=['GET'])
 def gost_get_config():
     try:
-        config_data = gost_mgmt.parameters_to_list()
+        rows = gost_mgmt.store.rows()
         return jsonify({
             "status": "success",
-            "data": config_data
+            "data": [list(row.values()) for row in rows],
+            # Column names for data; optional fields such as the limits follow the first five
+            "fields": list(rows[0]) if rows else list(listener_store.FIELDNAMES)
         })
     except Exception as e:
         return jsonify({
@@ -193,7 +548,13 @@ def gost_get_config():
 @app.route('/api/gost/generate_command', methods=['GET'])
 def generate_command():
     try:
-        config = gost_mgmt.construct_command()
+        if gost_config.gost_mode == 'pool':
+            config = gost_pool.pool_command()
+        elif gost_config.gost_mode == 'config':
+            config = gost_config.gost_command()
+        else:
+            current = gost_plan.plan.current()
+            return jsonify({"status": "success", "data": current["command"], "version": current["version"]})
         return jsonify({
             "status": "success",
             "data": config
@@ -220,6 +581,7 @@ def remove_config():
 
     try:
         gost_mgmt.remove_item_by_id(item_id)
+        reload_gost_listeners()
         return jsonify({"status": "success", "message": f"Item with ID {item_id} has been removed"})
     except FileNotFoundError:
         return jsonify({"status": "error", "message": "CSV file not found"}), 404
@@ -228,6 +590,19 @@ def remove_config():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+def with_mode_warning(payload, fields):
+    # GOST's command line has no per-client limiter and no per-node interfaces; both need a config file
+    if gost_config.gost_mode != 'command':
+        return payload
+    warnings = []
+    if fields.get('conn_rate'):
+        warnings.append("The per-IP connection rate is only enforced in GOST config or pool mode.")
+    if fields.get('interfaces'):
+        warnings.append("Extra egress interfaces are only used in GOST config or pool mode.")
+    if warnings:
+        payload["warning"] = " ".join(warnings)
+    return payload
+
 @app.route('/api/gost/add_config', methods=['POST'])
 def add_config():
     # Retrieve form data
@@ -235,28 +610,85 @@ def add_config():
     password = request.form.get('password')
     port = request.form.get('port')
     interface = request.form.get('interface')
+    pool = request.form.get('pool')
+    limits = {field: request.form.get(field) for field in gost_mgmt.LIMIT_FIELDS}
+    # Extra egress interfaces, ';'-separated, and the strategy used to pick one per connection
+    interfaces = request.form.get('interfaces')
+    strategy = request.form.get('strategy')
 
     # Perform the validations
     if not username or not password or not port or not interface:
         return jsonify({"status": "error", "message": "All fields are required."}), 400
 
-    if not gost_mgmt.is_valid_port(port):
-        return jsonify({"status": "error", "message": "Port must be a number between 1 and 65535."}), 400
+    # add_item validates the port, interface, limits and port uniqueness in one pass
+    try:
+        gost_mgmt.add_item( username, password, port, interface, pool, limits, interfaces, strategy)
+        reload_gost_listeners()
+        return jsonify(with_mode_warning({"status": "success", "message": "Configuration added successfully"},
+                                         dict(limits, interfaces=interfaces)))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
 
-    if interface not in gost_mgmt.get_network_interfaces():
-        return jsonify({"status": "error", "message": "Invalid network interface."}), 400
+def get_transfer_format():
+    # Explicit ?format= wins, otherwise guess from the Content-Type
+    fmt = request.args.get('format')
+    if fmt:
+        return fmt.lower()
+    content_type = request.mimetype or ''
+    if 'json' in content_type:
+        return 'jsonl'
+    return 'csv'
+
+@app.route('/api/gost/import', methods=['POST'])
+def import_gost_configs():
+    fmt = get_transfer_format()
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({"status": "error", "message": "Unsupported format. Use 'csv' or 'jsonl'."}), 400
+
+    # Accept either a multipart file upload or the raw request body, read line by line
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({"status": "error", "message": "No file uploaded."}), 400
+        stream = upload.stream
+    else:
+        stream = request.stream
 
-    if gost_mgmt.port_exists(port):
-        return jsonify({"status": "error", "message": "Port already exists."}), 400
+    # By default nothing is written unless every row is valid
+    atomic = request.args.get('partial', 'false').lower() not in ('1', 'true', 'yes')
 
     try:
-        gost_mgmt.add_item( username, password, port, interface)
-        return jsonify({"status": "success", "message": "Configuration added successfully"})
-    except ValueError as e:
-        return jsonify({"status": "error", "message": str(e)}), 400
+        lines = codecs.iterdecode(stream, 'utf-8')
+        result = gost_mgmt.import_items(gost_mgmt.parse_import_lines(lines, fmt), atomic=atomic)
+    except UnicodeDecodeError:
+        return jsonify({"status": "error", "message": "Upload must be UTF-8 encoded."}), 400
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+    if result["added"]:
+        reload_gost_listeners()
+    if result["errors"] and result["added"]:
+        # Only possible with ?partial=true: the valid rows were committed
+        return jsonify({"status": "partial", "added": result["added"], "errors": result["errors"]}), 207
+    if result["errors"]:
+        return jsonify({"status": "error", "added": 0, "errors": result["errors"]}), 400
+    return jsonify({"status": "success", "added": result["added"], "errors": []})
+
+@app.route('/api/gost/export', methods=['GET'])
+def export_gost_configs():
+    fmt = request.args.get('format', 'csv').lower()
+    try:
+        rows = gost_mgmt.export_items(fmt)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    mimetype = 'application/x-ndjson' if fmt == 'jsonl' else 'text/csv'
+    response = Response(stream_with_context(rows), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=parameters.{fmt}'
+    return response
+
 @app.route('/api/gost/get_interfaces', methods=['GET'])
 def api_get_network_interfaces():
     try:
@@ -273,6 +705,11 @@ def update_gost_config():
     new_password = request.form.get('password')
     new_port = request.form.get('port')
     new_interface = request.form.get('interface')
+    # Optional; leaving it out keeps the listener's pool
+    new_pool = request.form.get('pool')
+    new_limits = {field: request.form.get(field) for field in gost_mgmt.LIMIT_FIELDS}
+    new_interfaces = request.form.get('interfaces')
+    new_strategy = request.form.get('strategy')
 
     # Check if all required fields are provided
     if not all([item_id, new_username, new_password, new_port, new_interface]):
@@ -281,8 +718,11 @@ def update_gost_config():
     # You can then call a function to update the item
     try:
         # Assuming edit_item is defined elsewhere and updates the CSV
-        gost_mgmt.edit_item(item_id, new_username, new_password, new_port, new_interface)
-        return jsonify({"status": "success", "message": "Configuration updated successfully"}), 200
+        gost_mgmt.edit_item(item_id, new_username, new_password, new_port, new_interface, new_pool, new_limits,
+                            new_interfaces, new_strategy)
+        reload_gost_listeners()
+        return jsonify(with_mode_warning({"status": "success", "message": "Configuration updated successfully"},
+                                         dict(new_limits, interfaces=new_interfaces))), 200
     except ValueError as e:
         return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
@@ -291,45 +731,37 @@ def update_gost_config():
 
 @app.route('/api/gost/start', methods=['GET'])
 def start_gost():
+    if wants_job():
+        return queue_job('gost_start', 'gost', lambda target: gost_supervisor.start_gost())
     try:
-        # Check if GOST is already running
-        check_process = subprocess.run(["pgrep", "-f", "gost_auto"], stdout=subprocess.PIPE, text=True)
-        if check_process.stdout:
-            # GOST is already running
-            return jsonify({"status": "info", "message": "GOST is already running."})
-
-        # If not running, start GOST in a detached screen session
-        command = f"screen -dmS gost_auto {gost_mgmt.construct_command()}"
-        subprocess.run(command, shell=True, check=True)
-        return jsonify({"status": "success", "message": "GOST started successfully."})
-    except subprocess.CalledProcessError as e:
-        # This will catch errors like the screen session already existing
+        # The supervisor owns the GOST processes and restarts them if they crash
+        result = gost_supervisor.start_gost()
+        return jsonify(result), 500 if result["status"] == "error" else 200
+    except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/api/gost/status', methods=['GET'])
 def check_gost_status():
     try:
-        # Replace 'gost' with the actual process name or command used to run GOST
-        result = subprocess.run(["pgrep", "-f", "gost"], stdout=subprocess.PIPE)
-        
-        # If the return code is 0, the process is running
-        if result.returncode == 0:
-            return jsonify({"status": "success", "message": "GOST is running."})
-        else:
-            return jsonify({"status": "error", "message": "GOST is not running."})
+        if gost_config.gost_mode == 'pool':
+            shards = gost_pool.pool_status()
+            running = sum(1 for shard in shards if shard["running"])
+            status = "success" if running == len(shards) else "error"
+            return jsonify({"status": status, "message": f"{running}/{len(shards)} GOST shards running.", "data": shards})
+
+        # Answered from the supervisor's memory, no process table scan
+        return jsonify(gost_supervisor.gost_status())
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/api/gost/stop', methods=['GET'])
 def stop_gost():
+    if wants_job():
+        return queue_job('gost_stop', 'gost', lambda target: gost_supervisor.stop_gost())
     try:
-        # Use pkill to terminate all processes with the name 'gost'
-        subprocess.run(["pkill", "-f", "gost"], check=True)
-        
-        return jsonify({"status": "success", "message": "All GOST processes have been terminated."})
-    except subprocess.CalledProcessError:
-        # If pkill does not find any processes to kill, it will return a non-zero status
-        return jsonify({"status": "error", "message": "No GOST processes found or an error occurred while stopping GOST."}), 404
+        # Only the processes the supervisor started are signalled
+        result = gost_supervisor.stop_gost()
+        return jsonify(result), 404 if result["status"] == "error" else 200
     except Exception as e:
         # Catch any other exceptions and return an error response
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -337,7 +769,7 @@ def stop_gost():
 @app.route('/api/gost/save_command', methods=['GET'])
 def save_command():
     try:
-        command = gost_mgmt.construct_command()
+        command = gost_mgmt.saved_command_text()
         filename = 'gost_command.txt'
         with open(filename, 'w') as file:
             file.write(command)
@@ -353,6 +785,88 @@ def save_command():
             "message": str(e)
         }), 500
 
+@app.route('/api/gost/shards', methods=['GET'])
+def gost_shards_status():
+    if gost_config.gost_mode != 'pool':
+        return jsonify({"status": "error", "message": "GOST is not running in pool mode."}), 400
+    try:
+        return jsonify({"status": "success", "data": gost_pool.pool_status()})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def shard_route_error(shard):
+    if gost_config.gost_mode != 'pool':
+        return jsonify({"status": "error", "message": "GOST is not running in pool mode."}), 400
+    if not gost_pool.valid_shard(shard):
+        return jsonify({"status": "error", "message": f"Shard must be between 0 and {gost_pool.pool_size - 1}."}), 404
+    return None
+
+@app.route('/api/gost/shards/<int:shard>/status', methods=['GET'])
+def gost_shard_status(shard):
+    error = shard_route_error(shard)
+    if error is not None:
+        return error
+    try:
+        return jsonify({"status": "success", "data": gost_pool.shard_status(shard)})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/gost/shards/<int:shard>/start', methods=['GET'])
+def gost_shard_start(shard):
+    error = shard_route_error(shard)
+    if error is not None:
+        return error
+    try:
+        return jsonify(gost_pool.start_shard(shard))
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/gost/shards/<int:shard>/stop', methods=['GET'])
+def gost_shard_stop(shard):
+    error = shard_route_error(shard)
+    if error is not None:
+        return error
+    try:
+        result = gost_pool.stop_shard(shard)
+        return jsonify(result), 200 if result["status"] == "success" else 404
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/events', methods=['GET'])
+def event_stream():
+    # Server-sent events: a full snapshot first, then incremental change events
+    subscription = events.Subscription()
+    snapshot = events.hub.subscribe(subscription, limit=events.max_streams)
+    if snapshot is None:
+        # Every stream holds a worker thread; past the cap the dashboard falls back to polling
+        response = jsonify({"status": "error", "message": "Too many open event streams, poll instead"})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    def generate():
+        try:
+            yield "retry: 3000\n" + events.format_event(snapshot)
+            while not subscription.overflowed:
+                try:
+                    event = subscription.queue.get(timeout=events.heartbeat_interval)
+                except queue.Empty:
+                    # Comment line: keeps proxies from timing out and detects closed clients
+                    yield ": keepalive\n\n"
+                    continue
+                yield events.format_event(event)
+        finally:
+            events.hub.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Pre-rendered snapshot; collection happens on a background thread
+    return Response(metrics.snapshot.text(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     return render_template('index.html')
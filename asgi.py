@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from urllib.parse import parse_qs
+
+import api
+import events
+import metrics
+import wg_async
+import wg_inventory
+
+logger = logging.getLogger(__name__)
+
+# asyncio serving mode (API_SERVER=async in entrypoint.sh, run under uvicorn).
+# wg-quick up/down are served natively with asyncio subprocesses, so slow
+# tunnels only hold a coroutine. Every other route is the unchanged Flask app,
+# called on a thread pool so one slow request never blocks the event loop.
+wsgi_threads = int(os.environ.get('ASGI_WSGI_THREADS', '32'))
+executor = ThreadPoolExecutor(max_workers=wsgi_threads, thread_name_prefix='wsgi')
+
+
+async def send_json(send, payload, status=200):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def start_config(query):
+    interface_name = query.get('interface')
+    validation_result = api.validate_interface_name(interface_name)
+    if validation_result is not None:
+        return validation_result
+    # Same per-interface lock as queued jobs, so this never races a batch on the interface
+    async with wg_async.target_lock(interface_name):
+        result = await wg_async.bring_interface_up(interface_name)
+        wg_inventory.inventory.invalidate()
+        if result['status'] == 'success':
+            await asyncio.get_running_loop().run_in_executor(executor, api.cascade_interface_event, interface_name, 'up')
+    events.hub.notify()
+    if result['status'] == 'success':
+        return {"status": "success", "message": f"{interface_name} brought up successfully"}, 200
+    return {"status": "error", "message": f"Failed to bring up {interface_name}: {result['error_message']}"}, 200
+
+async def stop_config(query):
+    interface_name = query.get('interface')
+    validation_result = api.validate_interface_name(interface_name)
+    if validation_result is not None:
+        return validation_result
+    # Same per-interface lock as queued jobs, so this never races a batch on the interface
+    async with wg_async.target_lock(interface_name):
+        result = await wg_async.bring_interface_down(interface_name)
+        wg_inventory.inventory.invalidate()
+        if result['status'] in ['success', 'warning']:
+            await asyncio.get_running_loop().run_in_executor(executor, api.cascade_interface_event, interface_name, 'down')
+    events.hub.notify()
+    if result['status'] in ['success', 'warning']:
+        return {
+            "status": result['status'],
+            "message": f"{interface_name} brought down successfully",
+            "error_code": result.get('error_code', 0)
+        }, 200
+    return {
+        "status": "error",
+        "message": f"Failed to bring down {interface_name}",
+        "error_code": result.get('error_code', None),
+        "error_message": result.get('error_message', '')
+    }, 200
+
+async def event_stream(receive, send):
+    # Native /api/events: waits on an asyncio queue instead of holding a pool thread per dashboard
+    loop = asyncio.get_running_loop()
+    pending = asyncio.Queue()
+
+    def deliver(event):
+        # Called on the hub's poller thread
+        loop.call_soon_threadsafe(pending.put_nowait, event)
+
+    async def wait_for_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    snapshot = await loop.run_in_executor(executor, events.hub.subscribe, deliver)
+    disconnected = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"),
+                        (b"x-accel-buffering", b"no")]
+        })
+        await send({"type": "http.response.body", "body": ("retry: 3000\n" + events.format_event(snapshot)).encode(), "more_body": True})
+        while pending.qsize() <= events.max_queue:
+            next_event = asyncio.ensure_future(pending.get())
+            done, _ = await asyncio.wait({next_event, disconnected}, timeout=events.heartbeat_interval,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if next_event not in done:
+                next_event.cancel()
+            if disconnected in done:
+                return
+            chunk = events.format_event(next_event.result()) if next_event in done else ": keepalive\n\n"
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+        # Fell too far behind: end the stream, EventSource reconnects to a fresh snapshot
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        events.hub.unsubscribe(deliver)
+        disconnected.cancel()
+
+# (method, path) -> coroutine taking the query dict and returning (payload, status)
+NATIVE_ROUTES = {
+    ('GET', '/api/wireguard/start_config'): start_config,
+    ('GET', '/api/wireguard/stop_config'): stop_config,
+}
+
+
+def build_environ(scope, body):
+    server_name, server_port = scope.get("server") or ('localhost', 80)
+    client = scope.get("client") or ('', 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode('utf-8').decode('latin-1'),
+        "PATH_INFO": scope["path"].encode('utf-8').decode('latin-1'),
+        "QUERY_STRING": scope["query_string"].decode('latin-1'),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope["headers"]:
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            key = name
+        else:
+            key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+async def call_wsgi(scope, receive, send):
+    body = SpooledTemporaryFile(max_size=1024 * 1024)
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            body.close()
+            return
+        body.write(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    body.seek(0)
+
+    loop = asyncio.get_running_loop()
+
+    def send_sync(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def run():
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(' ', 1)[0])
+            response["headers"] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        def send_start():
+            if not response.get("sent"):
+                send_sync({"type": "http.response.start", "status": response["status"], "headers": response["headers"]})
+                response["sent"] = True
+
+        result = api.app(build_environ(scope, body), start_response)
+        try:
+            # Chunks are forwarded as they are produced so streamed responses stay streamed
+            for chunk in result:
+                if chunk:
+                    send_start()
+                    send_sync({"type": "http.response.body", "body": chunk, "more_body": True})
+            send_start()
+            send_sync({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+            body.close()
+
+    await loop.run_in_executor(executor, run)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    if scope["method"] == 'GET' and scope["path"] == '/api/events':
+        return await event_stream(receive, send)
+
+    query = {key: values[0] for key, values in parse_qs(scope["query_string"].decode('latin-1')).items()}
+    handler = NATIVE_ROUTES.get((scope["method"], scope["path"]))
+    if handler is None or query.get('async', 'false').lower() in ('1', 'true', 'yes'):
+        # ?async=1 queues a job exactly as it does under gunicorn
+        return await call_wsgi(scope, receive, send)
+
+    started = time.perf_counter()
+    try:
+        payload, status = await handler(query)
+    except Exception as e:
+        logger.error(f"{scope['path']} failed: {e}")
+        payload, status = {"status": "error", "message": f"Exception {e}"}, 500
+    await send_json(send, payload, status)
+    metrics.snapshot.histogram.observe(scope["path"], scope["method"], time.perf_counter() - started)
@@ -0,0 +1,332 @@
+"""Latency and throughput of the control-plane API at 10, 1k and 10k listeners and interfaces.
+
+Run from the repository root:
+
+    python3 benchmarks/bench_api.py [--sizes 10,1000,10000] [--clients 8] [--requests 100]
+                                    [--store csv|sqlite] [--output results.jsonl]
+
+For every size a temporary directory gets that many WireGuard configs (in
+place of /etc/wireguard) and that many listeners in parameters.csv. api.py
+is then served from it on a threaded WSGI server in a child process, with
+benchmarks/fakebin first on PATH so wg, wg-quick, gost, pgrep and pkill are
+harmless stand-ins. FAKE_WG_DELAY=0.05 makes the fakes sleep to mimic a
+real wg-quick.
+
+Each route is hit --requests times by --clients concurrent clients. Prints
+one JSON object per size and route: throughput, latency percentiles and a
+count per status, where "200:error" is a 200 whose body says
+{"status": "error"}. The first object of each size ("route": "startup")
+times seeding and server start. GOST runs in command mode; config and pool
+mode need a GOST web API, which the fake gost does not serve.
+"""
+import argparse
+import base64
+import http.client
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKEBIN = os.path.join(ROOT, 'benchmarks', 'fakebin')
+sys.path.insert(0, ROOT)
+
+SIZES = (10, 1000, 10000)
+SEED_PORT = 10000
+ADD_PORT = 50000
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+def make_key(seed):
+    return base64.b64encode(seed.to_bytes(4, 'big') * 8).decode('ascii')
+
+def make_config(index):
+    return "\n".join([
+        "[Interface]",
+        f"PrivateKey = {make_key(index)}",
+        f"Address = 10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}/32",
+        "DNS = 10.64.0.1",
+        "",
+        "[Peer]",
+        f"PublicKey = {make_key(index + 1000000)}",
+        "AllowedIPs = 0.0.0.0/0",
+        f"Endpoint = 198.51.100.{index % 250 + 1}:51820",
+        "",
+    ])
+
+def seed(root, size):
+    config_dir = os.path.join(root, 'wireguard')
+    os.makedirs(config_dir)
+    os.makedirs(os.path.join(root, 'wg_state'))
+    for index in range(1, size + 1):
+        with open(os.path.join(config_dir, f"wg{index}.conf"), 'w') as file:
+            file.write(make_config(index))
+    # Listeners egress through lo, which every host has, so adds and edits pass validation
+    with open(os.path.join(root, 'parameters.csv'), 'w') as file:
+        file.write("id,username,password,port,interface\n")
+        for index in range(1, size + 1):
+            file.write(f"{index},user{index},pass{index},{SEED_PORT + index},lo\n")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(root, port, store):
+    env = dict(os.environ,
+               PATH=f"{FAKEBIN}{os.pathsep}{os.environ.get('PATH', '')}",
+               FAKE_WG_STATE=os.path.join(root, 'wg_state'),
+               FAKE_WG_CONFIG_DIR=os.path.join(root, 'wireguard'),
+               LISTENER_STORE=store,
+               GOST_MODE='command',
+               WG_FALLBACK_INTERFACE='lo')
+    log = open(os.path.join(root, 'server.log'), 'ab')
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'serve', root, str(port)],
+                               cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+    log.close()
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API server exited with code {process.returncode}, see {root}/server.log")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/api/gost/status')
+            connection.getresponse().read()
+            connection.close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("API server did not come up within 120s")
+
+def stop_server(root, process):
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    # The GOST supervisor is a daemon of its own; it stops its fake gost on SIGTERM
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(2)
+            sock.connect(os.path.join(root, 'gost_supervisor.sock'))
+            sock.sendall(b'{"cmd": "ping"}\n')
+            with sock.makefile('rb') as response:
+                pid = json.loads(response.readline())["pid"]
+        os.kill(pid, signal.SIGTERM)
+    except (OSError, ValueError, KeyError):
+        return
+    # Wait for it, so the next size does not run next to a stopping GOST
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return
+        time.sleep(0.05)
+
+def serve(root, port):
+    # Child process: import the app with cwd-relative paths resolving into the temporary root
+    import logging
+    from werkzeug.serving import make_server
+
+    import api
+    import wg_mgmt
+
+    wg_mgmt.wg_config_path = os.path.join(root, 'wireguard')
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', port, api.app, threaded=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def failed(body):
+    if not body.startswith(b'{'):
+        return False
+    try:
+        return json.loads(body).get("status") == "error"
+    except ValueError:
+        return False
+
+def run(port, requests, clients):
+    """Send (method, path, body) requests from `clients` threads; returns (seconds, [(ms, status)])."""
+    pending = iter(requests)
+    lock = threading.Lock()
+    results = []
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                break
+            method, path, body = item
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body=body and urlencode(body), headers=FORM if body else {})
+                response = connection.getresponse()
+                status = response.status
+                if failed(response.read()):
+                    # Several routes answer 200 with {"status": "error"}
+                    status = f"{status}:error"
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+                status = 0
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                results.append((elapsed, status))
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, results
+
+def summarize(size, store, clients, name, seconds, results):
+    latencies = sorted(ms for ms, _ in results)
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "size": size,
+        "store": store,
+        "clients": clients,
+        "route": name,
+        "requests": len(results),
+        "errors": sum(1 for _, status in results if not (isinstance(status, int) and 200 <= status < 300)),
+        "status": statuses,
+        "seconds": round(seconds, 4),
+        "throughput_rps": round(len(results) / seconds, 2) if seconds else None,
+        "latency_ms": {
+            "min": round(latencies[0], 3),
+            "p50": round(percentile(latencies, 0.5), 3),
+            "p90": round(percentile(latencies, 0.9), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "max": round(latencies[-1], 3),
+            "mean": round(sum(latencies) / len(latencies), 3),
+        } if latencies else None,
+    }
+
+
+def scenarios(size, count, store):
+    """(name, clients override, warm up, requests) in the order they run; later ones rely on earlier ones."""
+    count = min(count, size)
+    interfaces = [f"wg{index}" for index in range(1, count + 1)]
+    added = [f"wg{size + index}" for index in range(1, count + 1)]
+    # The CSV store renumbers ids after a delete, so the first added listener is always size + 1
+    added_ids = [str(size + 1)] * count if store == 'csv' else [str(size + index) for index in range(1, count + 1)]
+    cycles = min(count, 10)
+    return [
+        ("GET /api/wireguard/interfaces", None, True, [('GET', '/api/wireguard/interfaces', None)] * count),
+        ("GET /api/wireguard/inventory", None, True, [('GET', '/api/wireguard/inventory', None)] * count),
+        ("GET /api/wireguard/get_config", None, True,
+         [('GET', f"/api/wireguard/get_config?interface={name}", None) for name in interfaces]),
+        ("GET /api/gost/get_config", None, True, [('GET', '/api/gost/get_config', None)] * count),
+        ("GET /api/gost/generate_command", None, True, [('GET', '/api/gost/generate_command', None)] * count),
+        ("POST /api/wireguard/add", None, False,
+         [('POST', '/api/wireguard/add', {'wg_config': make_config(size + index)}) for index in range(1, count + 1)]),
+        ("POST /api/wireguard/modify_config", None, False,
+         [('POST', '/api/wireguard/modify_config', {'interface': name, 'config': make_config(size + index)})
+          for index, name in enumerate(added, 1)]),
+        ("GET /api/wireguard/start_config", None, False,
+         [('GET', f"/api/wireguard/start_config?interface={name}", None) for name in interfaces]),
+        ("GET /api/wireguard/stop_config", None, False,
+         [('GET', f"/api/wireguard/stop_config?interface={name}", None) for name in interfaces]),
+        ("GET /api/wireguard/remove_config", None, False,
+         [('GET', f"/api/wireguard/remove_config?interface={name}", None) for name in added]),
+        ("POST /api/gost/add_config", None, False,
+         [('POST', '/api/gost/add_config', {'username': f"bench{index}", 'password': 'secret',
+                                            'port': ADD_PORT + index, 'interface': 'lo'})
+          for index in range(1, count + 1)]),
+        ("PUT /api/gost/update_config", None, False,
+         [('PUT', '/api/gost/update_config', {'id': index, 'username': f"user{index}", 'password': 'changed',
+                                              'port': SEED_PORT + index, 'interface': 'lo'})
+          for index in range(1, count + 1)]),
+        ("DELETE /api/gost/remove_config", None, False,
+         [('DELETE', f"/api/gost/remove_config?id={item_id}", None) for item_id in added_ids]),
+        # One GOST for the whole API: start/stop pairs only make sense one at a time
+        ("GET /api/gost/start+stop", 1, False,
+         [('GET', path, None) for _ in range(cycles) for path in ('/api/gost/start', '/api/gost/stop')]),
+        # Leave it running so status has something to report
+        ("GET /api/gost/start", 1, False, [('GET', '/api/gost/start', None)]),
+        ("GET /api/gost/status", None, True, [('GET', '/api/gost/status', None)] * count),
+    ]
+
+def bench_size(size, args, emit):
+    root = tempfile.mkdtemp(prefix=f"bench_api_{size}_")
+    try:
+        started = time.perf_counter()
+        seed(root, size)
+        port = free_port()
+        process = start_server(root, port, args.store)
+        emit({"size": size, "store": args.store, "route": "startup", "seconds": round(time.perf_counter() - started, 4)})
+        try:
+            for name, clients, warm, requests in scenarios(size, args.requests, args.store):
+                clients = clients or args.clients
+                if warm:
+                    # Fill the read caches so the first request of a route is not the one measured
+                    run(port, requests[:1], 1)
+                seconds, results = run(port, requests, clients)
+                emit(summarize(size, args.store, clients, name, seconds, results))
+        finally:
+            stop_server(root, process)
+    finally:
+        if args.keep:
+            print(f"Kept {root}", file=sys.stderr)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    if sys.argv[1:2] == ['serve']:
+        serve(sys.argv[2], int(sys.argv[3]))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=",".join(str(size) for size in SIZES),
+                        help="comma-separated listener/interface counts")
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help="requests per route (at most the size)")
+    parser.add_argument('--store', choices=('csv', 'sqlite'), default='csv')
+    parser.add_argument('--output', help="also append the JSON lines to this file")
+    parser.add_argument('--keep', action='store_true', help="keep the temporary directories")
+    args = parser.parse_args()
+
+    output = open(args.output, 'a') if args.output else None
+
+    def emit(result):
+        line = json.dumps(result)
+        print(line, flush=True)
+        if output:
+            output.write(line + "\n")
+            output.flush()
+
+    try:
+        for size in (int(size) for size in args.sizes.split(',')):
+            bench_size(size, args, emit)
+    finally:
+        if output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
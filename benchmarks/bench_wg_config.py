@@ -0,0 +1,80 @@
+"""Parse/normalise/serialise throughput of wg_config on large multi-peer configs.
+
+Run from the repository root:
+
+    python3 benchmarks/bench_wg_config.py [--repeat 5]
+
+Prints one JSON object per config size.
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wg_config  # noqa: E402
+
+PEER_COUNTS = (1, 10, 100, 1000, 10000)
+
+
+def make_key(seed):
+    return base64.b64encode(seed.to_bytes(4, 'big') * 8).decode('ascii')
+
+def make_config(peers):
+    lines = [
+        "[Interface]",
+        # Inline comments are stripped from values, as wg-quick does
+        f"PrivateKey = {make_key(0)} # main key",
+        "Address = 10.64.0.2/32,fc00:bbbb:bbbb:bb01::2/128",
+        "DNS = 10.64.0.1",
+        "",
+    ]
+    for index in range(1, peers + 1):
+        lines += [
+            "[Peer]",
+            f"PublicKey = {make_key(index)}  # peer {index}",
+            f"AllowedIPs = 10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}/32",
+            f"Endpoint = 198.51.100.{index % 250 + 1}:51820",
+            "PersistentKeepalive = 25",
+            "",
+        ]
+    return "\n".join(lines)
+
+def measure(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for peers in PEER_COUNTS:
+        text = make_config(peers)
+        parsed = wg_config.parse(text)
+        edited = wg_config.parse(text)
+        edited.peers[-1].set('Endpoint', '203.0.113.1:51820')
+        result = {
+            "peers": peers,
+            "bytes": len(text),
+            # Must stay 0: the generated keys carry inline comments
+            "validation_errors": len(parsed.validate()),
+            "parse_s": measure(lambda: wg_config.parse(text), args.repeat),
+            "normalize_serialize_s": measure(lambda: wg_config.normalize_config(text), args.repeat),
+            "validate_s": measure(parsed.validate, args.repeat),
+            "diff_s": measure(lambda: parsed.requires_restart(edited), args.repeat),
+        }
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,37 +3,21 @@
 # Exit on any error
 set -e
 
-# Print a message indicating that Gunicorn has been started in a screen session
-echo "Gunicorn has been started in a screen session named 'gunicorn_autostart'."
-
-# Your other script contents follow...
-gost_command=$(cat gost_command.txt)
-
-# Start the gost command in a screen session
-screen -dmS gost_autostart bash -c "$gost_command"
-
-# Print a message indicating that gost has been started
-echo "gost_autostart screen session has been started with the following command:"
-echo "$gost_command"
-
-# Check if the active_interfaces.txt file exists
-active_interfaces_file="active_interfaces.txt"
-if [ ! -e "$active_interfaces_file" ]; then
-    echo "Error: active_interfaces.txt not found."
-    exit 1
+# Bring the saved WireGuard interfaces up in parallel (see startup.py). Each GOST
+# program is started under the GOST supervisor as soon as the interfaces it
+# routes through are ready, and per-interface timings go to startup_report.json.
+# The API does not depend on the tunnels, so it starts right away.
+python3 startup.py &
+
+# Moves listeners off WireGuard tunnels that fail their probe, or stop handshaking
+# while they carry traffic or have a keepalive set (see wg_health.py)
+python3 wg_health.py &
+
+# API_SERVER=async serves the same API from asgi.py under uvicorn, so slow
+# wg-quick calls wait on the event loop instead of tying up a worker.
+if [ "$API_SERVER" = "async" ]; then
+    exec uvicorn asgi:app --workers=3 --host=0.0.0.0 --port=8000
 fi
 
-# Read the file line by line and run "wg-quick up" for each interface
-while IFS= read -r interface_name; do
-    if [ -n "$interface_name" ]; then
-        echo "Bringing up WireGuard interface: $interface_name"
-        wg-quick up "$interface_name"
-        if [ $? -eq 0 ]; then
-            echo "Successfully brought up $interface_name."
-        else
-            echo "Failed to bring up $interface_name."
-        fi
-    fi
-done < "$active_interfaces_file"
-
-gunicorn --workers=3 --bind=0.0.0.0:8000 'api:app'
+# Threads let the long-lived /api/events streams share a worker with normal requests
+gunicorn --workers=3 --threads=16 --bind=0.0.0.0:8000 'api:app'
@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import queue
+import threading
+
+import gost_mgmt
+import gost_supervisor
+import wg_inventory
+
+logger = logging.getLogger(__name__)
+
+# Dashboard state for /api/events. One poller thread per worker process
+# collects the state every poll_interval seconds while at least one stream is
+# open, diffs it against the previous poll and fans the change events out to
+# every subscriber, so N dashboards cost one poll instead of N request bursts.
+poll_interval = float(os.environ.get('EVENTS_INTERVAL', '2'))
+heartbeat_interval = 15
+max_queue = 256
+# Under gunicorn every open stream holds one of the worker's threads for as long
+# as it lasts, so only this many are served per worker; the rest are told to poll
+max_streams = int(os.environ.get('EVENTS_MAX_STREAMS', '4'))
+
+PROGRAM_FIELDS = ('name', 'running', 'pid', 'restarts', 'state')
+
+
+def collect_gost():
+    status = gost_supervisor.gost_status()
+    return [{field: program.get(field) for field in PROGRAM_FIELDS} for program in status["data"]]
+
+COLLECTORS = {
+    "interfaces": wg_inventory.inventory.snapshot,
+    "listeners": gost_mgmt.store.rows,
+    "gost": collect_gost,
+    "network_interfaces": lambda: sorted(gost_mgmt.get_network_interfaces()),
+}
+
+def collect_state(previous=None):
+    state = {}
+    for section, collect in COLLECTORS.items():
+        try:
+            state[section] = collect()
+        except Exception as e:
+            # Keep the last known value rather than reporting a spurious change
+            logger.error(f"Failed to collect {section} for events: {e}")
+            state[section] = (previous or {}).get(section, [])
+    return state
+
+
+def _diff_keyed(old, new, key, prefix):
+    old_by_key = {item[key]: item for item in old}
+    new_by_key = {item[key]: item for item in new}
+    events = []
+    for name, item in new_by_key.items():
+        if name not in old_by_key:
+            events.append((f"{prefix}_added", item))
+        elif old_by_key[name] != item:
+            events.append((f"{prefix}_changed", item))
+    for name, item in old_by_key.items():
+        if name not in new_by_key:
+            events.append((f"{prefix}_removed", item))
+    return events
+
+def diff_state(old, new):
+    """Return the (event name, data) pairs that turn old into new."""
+    events = []
+    old_interfaces = {entry["name"]: entry for entry in old["interfaces"]}
+    new_interfaces = {entry["name"]: entry for entry in new["interfaces"]}
+    for name, entry in new_interfaces.items():
+        previous = old_interfaces.get(name)
+        if previous is None:
+            events.append(("interface_added", entry))
+        elif previous["active"] != entry["active"]:
+            events.append(("interface_up" if entry["active"] else "interface_down", entry))
+    for name, entry in old_interfaces.items():
+        if name not in new_interfaces:
+            events.append(("interface_removed", entry))
+
+    # Listener ids are renumbered on delete, ports are unique and stable
+    events.extend(_diff_keyed(old["listeners"], new["listeners"], 'port', 'listener'))
+
+    old_programs = {program["name"]: program for program in old["gost"]}
+    for program in new["gost"]:
+        previous = old_programs.get(program["name"])
+        if previous is None or previous["running"] != program["running"]:
+            events.append(("gost_started" if program["running"] else "gost_stopped", program))
+        elif program["running"] and program["pid"] != previous["pid"]:
+            events.append(("gost_restarted", program))
+        elif program != previous:
+            events.append(("gost_changed", program))
+
+    if old["network_interfaces"] != new["network_interfaces"]:
+        events.append(("network_interfaces", new["network_interfaces"]))
+    return events
+
+def format_event(event):
+    event_id, name, data = event
+    return f"event: {name}\nid: {event_id}\ndata: {json.dumps(data)}\n\n"
+
+
+class Subscription:
+    """Bounded per-stream queue; a stream that falls behind is closed and the
+    browser's EventSource reconnects to a fresh snapshot."""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def __call__(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+
+class EventHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._subscribers = set()
+        self._state = None
+        self._seq = 0
+        self._thread = None
+
+    def subscribe(self, deliver, limit=None):
+        """Register deliver(event) and return the snapshot event it continues from.
+
+        Events are (id, name, data) tuples; ids increase by one per event.
+        Returns None instead when limit subscribers are already registered.
+        """
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            if self._state is None:
+                self._state = collect_state()
+            self._subscribers.add(deliver)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            return (self._seq, "snapshot", self._state)
+
+    def unsubscribe(self, deliver):
+        with self._lock:
+            self._subscribers.discard(deliver)
+
+    def notify(self):
+        # Poll now instead of waiting for the interval, e.g. after a change made here
+        self._wake.set()
+
+    def poll(self):
+        with self._lock:
+            previous = self._state
+        state = collect_state(previous)
+        with self._lock:
+            if self._state is not previous:
+                return
+            self._state = state
+            for name, data in diff_state(previous, state):
+                self._seq += 1
+                for deliver in list(self._subscribers):
+                    deliver((self._seq, name, data))
+
+    def _run(self):
+        while True:
+            self._wake.wait(poll_interval)
+            self._wake.clear()
+            with self._lock:
+                if not self._subscribers:
+                    # Nobody is listening: stop polling and forget the state
+                    self._thread = None
+                    self._state = None
+                    return
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Event poll failed: {e}")
+
+
+hub = EventHub()
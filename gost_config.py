@@ -0,0 +1,277 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import urllib.error
+import urllib.request
+from contextlib import ExitStack
+
+import gost_mgmt
+import profiling
+
+logger = logging.getLogger(__name__)
+
+# 'command' keeps the original single `gost -L ... -- -L ...` command line,
+# 'config' runs `gost -C gost_config.json` and applies listener changes
+# through the GOST web API without restarting the process.
+gost_mode = os.environ.get('GOST_MODE', 'command')
+config_path = os.environ.get('GOST_CONFIG_PATH', 'gost_config.json')
+api_addr = os.environ.get('GOST_API_ADDR', '127.0.0.1:18080')
+# GOST's Prometheus exporter, scraped by metrics.py for per-listener traffic
+metrics_addr = os.environ.get('GOST_METRICS_ADDR', '127.0.0.1:18090')
+api_timeout = 2
+# Failure thresholds for listeners that egress through several interfaces
+egress_max_fails = int(os.environ.get('GOST_EGRESS_MAX_FAILS', '1'))
+egress_fail_timeout = os.environ.get('GOST_EGRESS_FAIL_TIMEOUT', '30s')
+
+
+def service_name(row):
+    # Named by port, since listener ids are renumbered on delete
+    return f"service-{row['port']}"
+
+def chain_name(row):
+    return f"chain-{row['port']}"
+
+def limiter_name(kind, row):
+    return f"{kind}-{row['port']}"
+
+def build_limiters(row):
+    # kind -> limiter for the listener's limits: '$' is the whole service, '$$' each client IP
+    limiters = {}
+    if row.get('bandwidth_in') or row.get('bandwidth_out'):
+        # 0 leaves that direction unlimited
+        limits = f"$ {row.get('bandwidth_in') or 0} {row.get('bandwidth_out') or 0}"
+        limiters["limiter"] = {"name": limiter_name("limiter", row), "limits": [limits]}
+    if row.get('max_connections'):
+        limiters["climiter"] = {"name": limiter_name("climiter", row), "limits": [f"$ {row['max_connections']}"]}
+    if row.get('conn_rate'):
+        limiters["rlimiter"] = {"name": limiter_name("rlimiter", row), "limits": [f"$$ {row['conn_rate']}"]}
+    return limiters
+
+def build_service(row):
+    service = {
+        "name": service_name(row),
+        "addr": f":{row['port']}",
+        "handler": {
+            "type": "auto",
+            "auth": {"username": row['username'], "password": row['password']},
+            "chain": chain_name(row)
+        },
+        "listener": {"type": "tcp"}
+    }
+    for kind, limiter in build_limiters(row).items():
+        service[kind] = limiter["name"]
+    return service
+
+def build_node(row, interface, primary=True):
+    return {
+        # The primary node keeps its original name so existing chains diff as unchanged
+        "name": f"node-{row['port']}" if primary else f"node-{row['port']}-{interface}",
+        "addr": ":0",
+        "interface": interface,
+        "connector": {"type": "direct"},
+        "dialer": {"type": "direct"}
+    }
+
+def build_chain(row):
+    interfaces = gost_mgmt.egress_interfaces(row)
+    hop = {
+        "name": f"hop-{row['port']}",
+        "nodes": [build_node(row, interface, primary=index == 0) for index, interface in enumerate(interfaces)]
+    }
+    if len(interfaces) > 1:
+        # A node that fails max_fails times is skipped for fail_timeout
+        hop["selector"] = {
+            "strategy": row.get('strategy') or 'round',
+            "maxFails": egress_max_fails,
+            "failTimeout": egress_fail_timeout
+        }
+    return {"name": chain_name(row), "hops": [hop]}
+
+# Config section -> the service field that references it
+LIMITER_SECTIONS = {"limiters": "limiter", "climiters": "climiter", "rlimiters": "rlimiter"}
+
+def build_config(rows, api_address=None, metrics_address=None):
+    config = {
+        "services": [build_service(row) for row in rows],
+        "chains": [build_chain(row) for row in rows],
+    }
+    for section in LIMITER_SECTIONS:
+        config[section] = []
+    for row in rows:
+        for kind, limiter in build_limiters(row).items():
+            config[f"{kind}s"].append(limiter)
+    config["api"] = {"addr": api_address or api_addr}
+    config["metrics"] = {"addr": metrics_address or metrics_addr, "path": "/metrics"}
+    return config
+
+def read_config(path):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def write_config(path, config):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.gost_config.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump(config, file, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def diff_named(old_items, new_items):
+    # Returns (added, removed, changed) lists of objects keyed by 'name'
+    old = {item['name']: item for item in old_items or []}
+    new = {item['name']: item for item in new_items or []}
+    added = [new[name] for name in new if name not in old]
+    removed = [old[name] for name in old if name not in new]
+    changed = [new[name] for name in new if name in old and old[name] != new[name]]
+    return added, removed, changed
+
+
+def api_request(method, path, body=None, address=None):
+    url = f"http://{address or api_addr}{path}"
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+    with profiling.span('gost_api', f"{method} {url}"), urllib.request.urlopen(req, timeout=api_timeout) as response:
+        return response.status
+
+def api_available(address=None):
+    try:
+        api_request('GET', '/config', address=address)
+        return True
+    except (urllib.error.URLError, OSError):
+        return False
+
+def record_change(record, section, name, item=None):
+    # Mirror one successful API call in `record`: item replaces (or adds) `name`, None deletes it
+    items = [existing for existing in record.get(section) or [] if existing['name'] != name]
+    if item is not None:
+        items.append(item)
+    record[section] = items
+
+def apply_diff(old_config, new_config, address=None, record=None, phase=None):
+    """Push only the services, chains and limiters that changed to a running GOST instance.
+
+    When given, `record` (a copy of old_config) is updated after every call
+    that succeeded, so after a failure it still says what GOST has. phase
+    'remove' only deletes the removed services and 'add' does everything
+    else, so several instances can free ports before any binds them.
+    """
+    record = record if record is not None else {}
+    services_added, services_removed, services_changed = diff_named(old_config.get('services'), new_config.get('services'))
+    referenced = {section: diff_named(old_config.get(section), new_config.get(section))
+                  for section in ['chains', *LIMITER_SECTIONS]}
+
+    def call(method, section, item, name=None):
+        name = name or item['name']
+        path = f"/config/{section}" if method == 'POST' else f"/config/{section}/{name}"
+        api_request(method, path, item if method != 'DELETE' else None, address=address)
+        record_change(record, section, name, item if method != 'DELETE' else None)
+
+    # Services reference chains and limiters by name: create those before the
+    # services that use them and delete them only once no service does.
+    if phase != 'add':
+        for service in services_removed:
+            call('DELETE', 'services', service)
+    if phase == 'remove':
+        return {"added": 0, "removed": len(services_removed), "changed": 0}
+    for section, (added, _, changed) in referenced.items():
+        for item in added:
+            call('POST', section, item)
+        for item in changed:
+            call('PUT', section, item)
+    for service in services_added:
+        call('POST', 'services', service)
+    for service in services_changed:
+        call('PUT', 'services', service)
+    for section, (_, removed, _) in referenced.items():
+        for item in removed:
+            call('DELETE', section, item)
+
+    return {
+        "added": len(services_added),
+        "removed": len(services_removed) if phase is None else 0,
+        "changed": len(services_changed) + sum(len(changed) for _, _, changed in referenced.values())
+    }
+
+
+def sync_configs(targets, select_rows=None):
+    """Render configs from the listener store and hot-apply the differences.
+
+    targets are (path, api address, metrics address) tuples, one per GOST
+    instance; select_rows(rows) returns each one's listeners, in the same
+    order. The previously rendered file is the record of what the running
+    GOST has, so any gunicorn worker can compute the diff. The file locks
+    keep two workers from applying the same change twice, and the listeners
+    are read under them so a worker with an older snapshot cannot roll a
+    newer one back. Removed services are deleted from every instance before
+    anything is added, so a listener that moves between pool shards frees
+    its port before the new shard binds it.
+    """
+    with ExitStack() as stack:
+        # Always taken in target order; closing each file releases its lock
+        for path, _, _ in targets:
+            lock_file = stack.enter_context(open(f"{path}.lock", 'a'))
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        rows = gost_mgmt.store.rows()
+        selected = select_rows(rows) if select_rows is not None else [rows] * len(targets)
+        syncs = []
+        for (path, address, metrics_address), target_rows in zip(targets, selected):
+            old_config = read_config(path)
+            new_config = build_config(target_rows, address, metrics_address)
+            syncs.append({
+                "path": path,
+                "address": address,
+                "old": old_config,
+                "new": new_config,
+                "live": old_config != new_config and api_available(address),
+                "record": dict(old_config),
+                "error": None,
+                "result": {"status": "success", "applied": False, "added": 0, "removed": 0, "changed": 0}
+            })
+
+        for phase in ('remove', 'add'):
+            for sync in syncs:
+                if not sync["live"] or sync["error"] is not None:
+                    continue
+                try:
+                    counts = apply_diff(sync["old"], sync["new"], sync["address"], sync["record"], phase)
+                except (urllib.error.URLError, OSError) as e:
+                    logger.error(f"Failed to apply GOST config change via API at {sync['address']}: {e}")
+                    sync["error"] = e
+                    continue
+                for key, value in counts.items():
+                    sync["result"][key] += value
+
+        results = []
+        for sync in syncs:
+            if sync["error"] is not None:
+                # Keep what did apply; the rest is retried by the next sync
+                write_config(sync["path"], sync["record"])
+                results.append({"status": "error", "applied": False,
+                                "message": f"GOST API error, restart GOST to apply: {sync['error']}"})
+                continue
+            # Applied, or nothing is listening and GOST loads the file when it starts
+            write_config(sync["path"], sync["new"])
+            sync["result"]["applied"] = sync["live"]
+            results.append(sync["result"])
+        return results
+
+def sync_config(select_rows=None, path=None, address=None, metrics_address=None):
+    """sync_configs() for a single GOST; select_rows picks its listeners out of all of them."""
+    target = (path or config_path, address or api_addr, metrics_address)
+    return sync_configs([target], None if select_rows is None else lambda rows: [select_rows(rows)])[0]
+
+def gost_command(path=None):
+    return f"gost -C {path or config_path}"
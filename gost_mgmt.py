@@ -1,10 +1,23 @@
 import csv
+import io
+import json
 import subprocess
 import base64
 import os
 import re
+import sys
+import listener_store
+import profiling
 
 filepath = 'parameters.csv'
+# LISTENER_STORE=sqlite keeps listeners in listeners.db (imported once from the
+# CSV); LISTENER_EXPORT_CSV=1 keeps parameters.csv written for the shell scripts
+store_backend = os.environ.get('LISTENER_STORE', 'csv')
+store_db_path = os.environ.get('LISTENER_DB', 'listeners.db')
+store_export_csv = os.environ.get('LISTENER_EXPORT_CSV', '0').lower() in ('1', 'true', 'yes')
+
+# Shared, cached view of the listeners; only re-read when another process writes
+store = listener_store.open_store(store_backend, filepath, store_db_path, export_csv=store_export_csv)
 
 def sanitize_csv_value(value):
     # Remove CSV special characters (commas and double-quotes)
@@ -18,36 +31,19 @@ def is_valid_port(port):
         return False
 
 def port_exists(port):
-    with open(filepath, 'r', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if row['port'] == port:
-                return True
-    return False
+    return store.port_exists(port)
 
 def cleanup_csv_ids():
-    # Read all data from the CSV
-    with open(filepath, 'r', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        rows = list(reader)  # Convert the reader to a list to iterate over it twice
-
     # Reset IDs to be sequential starting from 1
-    for i, row in enumerate(rows, start=1):
-        row['id'] = str(i)
-
-    # Write the data back to the CSV
-    with open(filepath, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=reader.fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
+    store.renumber()
 
 def read_parameters_from_csv(filepath):
-    with open(filepath, newline='') as csvfile:
+    with profiling.span('file', f"read {filepath}"), open(filepath, newline='') as csvfile:
         reader = csv.DictReader(csvfile)
         return [row for row in reader]
 
 def write_parameters_to_csv(filepath, parameters):
-    with open(filepath, 'w', newline='') as csvfile:
+    with profiling.span('file', f"write {filepath}"), open(filepath, 'w', newline='') as csvfile:
         fieldnames = ['username', 'password', 'port', 'interface']
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
 
@@ -64,42 +60,123 @@ def base64_encode_username_password(username, password):
 
 def get_network_interfaces():
     base_path = '/sys/class/net/'
-    interfaces = os.listdir(base_path)
+    with profiling.span('file', f"list {base_path}"):
+        interfaces = os.listdir(base_path)
     return interfaces  
 
-def construct_command():
-    parameters = read_parameters_from_csv(filepath)
-    command_parts = ["gost"]
+def listener_args(param):
+    # The `-L ... -F ...` arguments of one listener in the single-command launch
+    encoded_auth = base64_encode_username_password(param['username'], param['password'])
+    options = f"auth={encoded_auth}"
+    if param.get('bandwidth_in'):
+        options += f"&limiter.in={param['bandwidth_in']}"
+    if param.get('bandwidth_out'):
+        options += f"&limiter.out={param['bandwidth_out']}"
+    if param.get('max_connections'):
+        options += f"&climiter={param['max_connections']}"
+    # The command line has no per-client request limiter, so conn_rate needs config or pool mode
+    return ["-L", f":{param['port']}?{options}", "-F", f"direct://:0?interface={param['interface']}"]
+
+def command_argv(parameters, args_for=listener_args):
+    argv = ["gost"]
     for index, param in enumerate(parameters):
-        encoded_auth = base64_encode_username_password(param['username'], param['password'])
-        listener = f"-L :{param['port']}?auth={encoded_auth} -F direct://:0?interface={param['interface']}"
-        command_parts.append(listener)
         if index > 0:
             # Add the separator before all listeners except the first one
-            command_parts.insert(-1, "--")
-    return " ".join(command_parts)
+            argv.append("--")
+        argv.extend(args_for(param))
+    return argv
+
+def construct_command():
+    # Served from the launch plan, which only re-encodes the listeners that changed
+    import gost_plan
+
+    return gost_plan.plan.current()["command"]
 
 def parameters_to_list():
-    dict_rows = read_parameters_from_csv(filepath)
+    dict_rows = store.rows()
     lines = [list(row.values()) for row in dict_rows]
     return lines
 
 
 def remove_item_by_id(item_id):
-    # Read all data from the CSV
-    with open(filepath, 'r', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        rows = [row for row in reader if row['id'] != item_id]
+    # Drops the row in a single write; the CSV backend also renumbers the remaining IDs
+    store.remove(item_id)
 
-    # Write data back to CSV, excluding the row with the specified ID
-    with open(filepath, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=reader.fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
-    cleanup_csv_ids()
 
+def validate_pool_name(pool):
+    # Pools are plain names, e.g. "eu"; empty means the listener is pinned to its interface
+    pool = str(pool or '').strip()
+    if pool and not re.match(r'^[A-Za-z0-9_.-]{1,64}$', pool):
+        raise ValueError("Invalid pool name. Use letters, digits, '.', '_' or '-'.")
+    return pool
+
+# Optional per-listener limits; empty means unlimited
+LIMIT_FIELDS = ('bandwidth_in', 'bandwidth_out', 'max_connections', 'conn_rate')
+
+def parse_bandwidth(value):
+    # Bytes per second in GOST's notation: 512KB, 10MB, 1GiB; a bare number is bytes
+    match = re.match(r'^(\d+)\s*([KMGT]I?)?B?$', value, re.IGNORECASE)
+    if not match or int(match.group(1)) == 0:
+        raise ValueError("Bandwidth must be a positive size per second, e.g. 512KB or 10MB.")
+    prefix = (match.group(2) or '').upper().replace('I', 'i')
+    return f"{int(match.group(1))}{prefix}B"
+
+def validate_limits(limits):
+    """Normalise the limit fields present in limits; '' clears a limit."""
+    validated = {}
+    for field in LIMIT_FIELDS:
+        if field not in limits or limits[field] is None:
+            continue
+        value = str(limits[field]).strip()
+        if not value:
+            validated[field] = ''
+        elif field in ('bandwidth_in', 'bandwidth_out'):
+            validated[field] = parse_bandwidth(value)
+        elif field == 'max_connections':
+            if not value.isdigit() or not 1 <= int(value) <= 1000000:
+                raise ValueError("Max connections must be a number between 1 and 1000000.")
+            validated[field] = str(int(value))
+        else:
+            try:
+                rate = float(value)
+            except ValueError:
+                rate = 0
+            if not 0 < rate <= 100000:
+                raise ValueError("Connection rate must be a number of connections per second above 0.")
+            validated[field] = f"{rate:g}"
+    return validated
 
-def add_item(username, password, port, interface):
+# GOST hop selector strategies for listeners with several egress interfaces.
+# GOST has no least-connections selector; 'hash' keeps the same request key on the same tunnel.
+EGRESS_STRATEGIES = ('round', 'rand', 'fifo', 'hash')
+
+def egress_interfaces(row):
+    # The primary interface first, then the extra ones from the ';'-separated 'interfaces' field
+    extra = [name for name in (row.get('interfaces') or '').split(';') if name and name != row['interface']]
+    return [row['interface'], *dict.fromkeys(extra)]
+
+def validate_egress(interfaces, strategy, available):
+    """Normalise the extra egress interfaces (a list or ';'-separated) and their strategy.
+
+    Returns the changes for the row; '' clears the field.
+    """
+    changes = {}
+    if interfaces is not None:
+        if isinstance(interfaces, str):
+            interfaces = interfaces.replace(',', ';').split(';')
+        names = list(dict.fromkeys(name.strip() for name in interfaces if name and name.strip()))
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise ValueError(f"Invalid network interface: {', '.join(unknown)}")
+        changes['interfaces'] = ';'.join(names)
+    if strategy is not None:
+        strategy = str(strategy).strip().lower()
+        if strategy and strategy not in EGRESS_STRATEGIES:
+            raise ValueError(f"Strategy must be one of: {', '.join(EGRESS_STRATEGIES)}.")
+        changes['strategy'] = strategy
+    return changes
+
+def add_item(username, password, port, interface, pool=None, limits=None, interfaces=None, strategy=None):
     # Sanitize username and password
     username = sanitize_csv_value(username)
     password = sanitize_csv_value(password)
@@ -109,64 +186,173 @@ def add_item(username, password, port, interface):
         raise ValueError("Port must be a number between 1 and 65535.")
 
     # Check for a valid interface
-    if interface not in get_network_interfaces():
+    available = get_network_interfaces()
+    if interface not in available:
         raise ValueError("Invalid network interface.")
 
-    # Read the existing data to find the maximum id
-    with open(filepath, 'r', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        existing_ids = [int(row['id']) for row in reader if row['id'].isdigit()]
-        max_id = max(existing_ids, default=0)
+    row = {
+        'username': username,
+        'password': password,
+        'port': port,
+        'interface': interface
+    }
+    pool = validate_pool_name(pool)
+    if pool:
+        row['pool'] = pool
+    row.update({field: value for field, value in validate_limits(limits or {}).items() if value})
+    row.update({field: value for field, value in validate_egress(interfaces, strategy, available).items() if value})
 
-    if port_exists(port):
-        raise ValueError("Port already exists.")
+    # The store assigns the next id and rejects ports that are already in use
+    store.add(row)
 
-    # Write the new entry with the next id
-    with open(filepath, 'a', newline='') as csvfile:
-        fieldnames = ['id', 'username', 'password', 'port', 'interface']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        if csvfile.tell() == 0:  # File is empty, write header
+def edit_item(item_id, new_username, new_password, new_port, new_interface, new_pool=None, new_limits=None,
+              new_interfaces=None, new_strategy=None):
+    changes = {
+        'username': sanitize_csv_value(new_username),
+        'password': sanitize_csv_value(new_password),
+    }
+    # Invalid ports and interfaces keep the row's current value
+    available = get_network_interfaces()
+    if is_valid_port(new_port):
+        changes['port'] = new_port
+    if new_interface in available:
+        changes['interface'] = new_interface
+    # None leaves the pool alone, '' takes the listener out of its pool
+    if new_pool is not None:
+        changes['pool'] = validate_pool_name(new_pool)
+    # Only the limits that were passed change
+    changes.update(validate_limits(new_limits or {}))
+    changes.update(validate_egress(new_interfaces, new_strategy, available))
+
+    store.update(item_id, changes)
+
+IMPORT_FIELDS = ['username', 'password', 'port', 'interface']
+
+def parse_import_lines(lines, fmt):
+    # Yields (line_number, row) pairs; row is a ValueError for unparseable lines
+    if fmt == 'jsonl':
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f"Invalid JSON: {e}")
+                continue
+            if not isinstance(row, dict):
+                yield line_number, ValueError("Expected a JSON object.")
+                continue
+            yield line_number, row
+    elif fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            # Header is line 1, so data rows match the editor's line numbers
+            yield reader.line_num, row
+    else:
+        raise ValueError("Unsupported import format. Use 'csv' or 'jsonl'.")
+
+def validate_import_row(row, interfaces):
+    missing = [field for field in IMPORT_FIELDS if not str(row.get(field) or '').strip()]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+
+    port = str(row['port']).strip()
+    if not is_valid_port(port):
+        raise ValueError("Port must be a number between 1 and 65535.")
+
+    interface = str(row['interface']).strip()
+    if interface not in interfaces:
+        raise ValueError("Invalid network interface.")
+
+    validated = {
+        'username': sanitize_csv_value(str(row['username'])),
+        'password': sanitize_csv_value(str(row['password'])),
+        'port': port,
+        'interface': interface
+    }
+    pool = validate_pool_name(row.get('pool'))
+    if pool:
+        validated['pool'] = pool
+    validated.update({field: value for field, value in validate_limits(row).items() if value})
+    validated.update({field: value for field, value in
+                      validate_egress(row.get('interfaces'), row.get('strategy'), interfaces).items() if value})
+    return validated
+
+def import_items(parsed_rows, atomic=True):
+    # One interface snapshot for the whole batch, one write at the end
+    interfaces = set(get_network_interfaces())
+    valid = []
+    errors = []
+    for line_number, row in parsed_rows:
+        try:
+            if isinstance(row, Exception):
+                raise row
+            valid.append((line_number, validate_import_row(row, interfaces)))
+        except ValueError as e:
+            errors.append({"line": line_number, "error": str(e)})
+
+    if errors and atomic:
+        return {"added": 0, "errors": errors}
+
+    # Port conflicts (with existing rows or within the batch) are reported by the store
+    added, store_errors = store.add_many(valid, atomic=atomic)
+    errors = sorted(errors + store_errors, key=lambda error: error["line"])
+    return {"added": len(added), "errors": errors}
+
+def _export_jsonl():
+    for row in store.iter_rows():
+        yield json.dumps(row) + '\n'
+
+def _export_csv():
+    buffer = io.StringIO()
+    writer = None
+    for row in store.iter_rows():
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row.keys()))
             writer.writeheader()
-        
-        writer.writerow({
-            'id': max_id + 1,
-            'username': username,
-            'password': password,
-            'port': port,
-            'interface': interface
-        })
-
-def edit_item(item_id, new_username, new_password, new_port, new_interface):
-    # First, read all data from the CSV file
-    with open(filepath, 'r', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        rows = list(reader)
-    
-    # Update the row where the id matches item_id
-    item_found = False
-    for row in rows:
-        if row['id'] == str(item_id):
-            # Sanitize new values and update the row
-            row['username'] = sanitize_csv_value(new_username)
-            row['password'] = sanitize_csv_value(new_password)
-            row['port'] = new_port if is_valid_port(new_port) else row['port']
-            row['interface'] = new_interface if new_interface in get_network_interfaces() else row['interface']
-            item_found = True
-            break
-    
-    if not item_found:
-        raise ValueError("Item with the specified ID not found.")
-
-    # Write the updated data back to the CSV file
-    with open(filepath, 'w', newline='') as csvfile:
-        fieldnames = ['id', 'username', 'password', 'port', 'interface']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
-    
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if writer is None:
+        yield ','.join(['id'] + IMPORT_FIELDS) + '\r\n'
+
+def export_items(fmt):
+    # Returns a generator so large listener sets are never built up in memory
+    if fmt == 'jsonl':
+        return _export_jsonl()
+    if fmt == 'csv':
+        return _export_csv()
+    raise ValueError("Unsupported export format. Use 'csv' or 'jsonl'.")
+
+def saved_command_text():
+    # What "Save Command" writes to gost_command.txt for the current GOST mode
+    import gost_config
+    import gost_pool
+
+    if gost_config.gost_mode == 'pool':
+        gost_pool.sync_shards()
+        return gost_pool.pool_command()
+    if gost_config.gost_mode == 'config':
+        # The command only points at the config file, so render that too
+        gost_config.sync_config()
+        return gost_config.gost_command()
+    return construct_command()
+
+def export_for_scripts(command_path='gost_command.txt'):
+    # parameters.csv and gost_command.txt for the shell scripts when listeners live in SQLite
+    if store_backend != 'csv':
+        store.export_csv(filepath)
+    command = saved_command_text()
+    with profiling.span('file', f"write {command_path}"), open(command_path, 'w') as file:
+        file.write(command)
+
 if __name__ == "__main__":
-    print(get_network_interfaces())
+    if sys.argv[1:2] == ['export']:
+        export_for_scripts()
+        print(f"Wrote {filepath} and gost_command.txt")
+    else:
+        print(get_network_interfaces())
 """    filepath = 'parameters.csv'  # The CSV file path
     parameters = read_parameters_from_csv(filepath)
     command = construct_command(parameters)
@@ -0,0 +1,155 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shlex
+import sys
+import tempfile
+import threading
+import time
+
+import gost_config
+import gost_mgmt
+import listener_store
+
+# The launch plan is the compiled single-command GOST argv. It is written to
+# gost_plan.json (and gost_command.txt in command mode) whenever the listeners
+# change, tagged with the store revision it was built from, so start and
+# generate calls reuse it instead of re-encoding every listener. When the
+# store does change, only the listeners whose fields changed are re-encoded.
+# "version" is a hash of the command itself; "source" is a hash of the
+# listener fields, which lets the start-up scripts detect a stale plan.
+plan_path = os.environ.get('GOST_PLAN_PATH', 'gost_plan.json')
+command_path = 'gost_command.txt'
+
+PLAN_FIELDS = ('username', 'password', 'port', 'interface', *gost_mgmt.LIMIT_FIELDS)
+
+
+def row_key(row):
+    return tuple(str(row.get(field, '')) for field in PLAN_FIELDS)
+
+def source_hash(rows):
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update(json.dumps(row_key(row)).encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+def _write_atomic(path, text):
+    # gost_command.txt is bind-mounted in the docker setup, where it is rewritten in place under the lock
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.write(text)
+        with open(f"{path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            listener_store.replace_file(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class LaunchPlan:
+    def __init__(self, path=None):
+        self.path = path or plan_path
+        self._lock = threading.Lock()
+        self._plan = None
+        self._fragments = {}  # port -> (row key, argv fragment)
+        self._encoded = 0
+
+    def _listener_args(self, row):
+        key = row_key(row)
+        cached = self._fragments.get(key[2])
+        if cached is None or cached[0] != key:
+            cached = (key, gost_mgmt.listener_args(row))
+            self._fragments[key[2]] = cached
+            self._encoded += 1
+        return cached[1]
+
+    def build(self, rows, revision=None):
+        """Compile rows into a plan, re-encoding only the listeners that changed since the last build."""
+        self._encoded = 0
+        argv = gost_mgmt.command_argv(rows, self._listener_args)
+        ports = {str(row['port']) for row in rows}
+        for port in [port for port in self._fragments if port not in ports]:
+            del self._fragments[port]
+        # Quoted, since limit options join with "&"; the supervisor shlex.splits it back
+        command = shlex.join(argv)
+        return {
+            "version": hashlib.sha256(command.encode('utf-8')).hexdigest()[:16],
+            "source": source_hash(rows),
+            "revision": revision,
+            "listeners": len(rows),
+            "encoded": self._encoded,
+            "built": time.time(),
+            "argv": argv,
+            "command": command
+        }
+
+    def load(self):
+        try:
+            with open(self.path) as file:
+                plan = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+        plan["command"] = shlex.join(plan.get("argv", []))
+        return plan
+
+    def write(self, plan):
+        _write_atomic(self.path, json.dumps({key: value for key, value in plan.items() if key != "command"}))
+        if gost_config.gost_mode == 'command':
+            # Kept in step with the listeners instead of waiting for "Save Command"
+            _write_atomic(command_path, plan["command"])
+
+    def current(self):
+        """The plan for the listeners as they are now, rebuilt and written only if they changed."""
+        with self._lock:
+            # Read the revision before the rows: a write in between only causes one extra rebuild
+            revision = gost_mgmt.store.revision()
+            if self._plan is not None and self._plan["revision"] == revision:
+                return self._plan
+            loaded = self.load()
+            if loaded is not None and loaded.get("revision") == revision:
+                # Another worker already built it
+                self._plan = loaded
+                return loaded
+            return self._rebuild(revision)
+
+    def rebuild(self):
+        with self._lock:
+            return self._rebuild(gost_mgmt.store.revision())
+
+    def _rebuild(self, revision):
+        # Caller must hold self._lock
+        self._plan = self.build(gost_mgmt.store.rows(), revision)
+        self.write(self._plan)
+        return self._plan
+
+    def is_stale(self):
+        # Compares the listener fields themselves, so it also catches a store edited behind our back
+        loaded = self.load()
+        return loaded is None or loaded.get("source") != source_hash(gost_mgmt.store.rows())
+
+
+plan = LaunchPlan()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    action = sys.argv[1] if len(sys.argv) > 1 else 'check'
+    if action == 'check':
+        # Exit status 1 tells the scripts the plan no longer matches the listeners
+        stale = plan.is_stale()
+        print("Launch plan is stale." if stale else "Launch plan is up to date.")
+        sys.exit(1 if stale else 0)
+    elif action == 'build':
+        current = plan.rebuild()
+        print(f"Launch plan {current['version']}: {current['listeners']} listeners, {current['encoded']} encoded")
+    else:
+        print(f"Usage: {sys.argv[0]} check|build")
+        sys.exit(2)
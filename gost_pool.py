@@ -0,0 +1,129 @@
+import os
+import shlex
+import zlib
+
+import gost_config
+import gost_mgmt
+import gost_supervisor
+
+# Pool mode (GOST_MODE=pool) splits listeners over several GOST processes,
+# each with its own config file and web API port, so a single process is
+# never the CPU/file-descriptor bottleneck and one crash only takes down
+# its own share of the listeners.
+pool_size = int(os.environ.get('GOST_POOL_SIZE', '0')) or os.cpu_count() or 1
+# 'interface' keeps every listener of an egress interface in one shard,
+# 'port' spreads listeners evenly by port number.
+pool_strategy = os.environ.get('GOST_POOL_STRATEGY', 'interface')
+pool_dir = os.environ.get('GOST_POOL_DIR', 'gost_shards')
+api_port_base = int(os.environ.get('GOST_POOL_API_PORT', '18100'))
+metrics_port_base = int(os.environ.get('GOST_POOL_METRICS_PORT', '18200'))
+
+
+def shard_for(row, size=None):
+    size = size or pool_size
+    if pool_strategy == 'port':
+        return int(row['port']) % size
+    # crc32 rather than hash() so every worker agrees on the placement
+    return zlib.crc32(row['interface'].encode('utf-8')) % size
+
+def partition(rows, size=None):
+    size = size or pool_size
+    shards = [[] for _ in range(size)]
+    for row in rows:
+        shards[shard_for(row, size)].append(row)
+    return shards
+
+def shard_config_path(shard):
+    return os.path.join(pool_dir, f"shard_{shard}.json")
+
+def shard_api_addr(shard):
+    return f"127.0.0.1:{api_port_base + shard}"
+
+def shard_metrics_addr(shard):
+    return f"127.0.0.1:{metrics_port_base + shard}"
+
+def shard_session(shard):
+    return f"gost_shard_{shard}"
+
+def valid_shard(shard):
+    return 0 <= shard < pool_size
+
+
+def sync_shards():
+    # A listener whose shard changed is removed from the old shard's GOST
+    # before it is added to the new one; untouched shards see an empty diff.
+    os.makedirs(pool_dir, exist_ok=True)
+    targets = [(shard_config_path(shard), shard_api_addr(shard), shard_metrics_addr(shard)) for shard in range(pool_size)]
+    results = gost_config.sync_configs(targets, partition)
+    return [dict(result, shard=shard) for shard, result in enumerate(results)]
+
+def sync_shard(shard):
+    os.makedirs(pool_dir, exist_ok=True)
+    return gost_config.sync_config(lambda rows: partition(rows)[shard], shard_config_path(shard),
+                                   shard_api_addr(shard), shard_metrics_addr(shard))
+
+
+def shard_program(shard):
+    return f"shard-{shard}"
+
+def shard_argv(shard):
+    return shlex.split(gost_config.gost_command(shard_config_path(shard)))
+
+def supervised_shards():
+    # name -> supervisor status, empty when the supervisor is not running
+    if not gost_supervisor.ping():
+        return {}
+    return {program["name"]: program for program in gost_supervisor.call('status')["data"]}
+
+def is_shard_running(shard):
+    program = supervised_shards().get(shard_program(shard))
+    return bool(program and program["running"])
+
+def start_shard(shard):
+    if not gost_supervisor.ensure_running():
+        return {"status": "error", "message": "GOST supervisor is not running."}
+    sync_shard(shard)
+    result = gost_supervisor.call('start', name=shard_program(shard), argv=shard_argv(shard))
+    if result["status"] == "info":
+        return {"status": "info", "message": f"Shard {shard} is already running."}
+    return result
+
+def stop_shard(shard):
+    if not gost_supervisor.ping():
+        return {"status": "error", "message": f"Shard {shard} is not running."}
+    return gost_supervisor.call('stop', name=shard_program(shard))
+
+def shard_status(shard, rows=None, programs=None):
+    if rows is None:
+        rows = partition(gost_mgmt.store.rows())[shard]
+    if programs is None:
+        programs = supervised_shards()
+    program = programs.get(shard_program(shard)) or {}
+    return {
+        "shard": shard,
+        "running": bool(program.get("running")),
+        "pid": program.get("pid"),
+        "uptime": program.get("uptime", 0),
+        "restarts": program.get("restarts", 0),
+        "last_exit_code": program.get("last_exit_code"),
+        "listeners": len(rows),
+        "ports": [row['port'] for row in rows],
+        "api": shard_api_addr(shard),
+        "config": shard_config_path(shard)
+    }
+
+def pool_status():
+    shards = partition(gost_mgmt.store.rows())
+    programs = supervised_shards()
+    return [shard_status(shard, rows, programs) for shard, rows in enumerate(shards)]
+
+def start_pool():
+    return [dict(start_shard(shard), shard=shard) for shard in range(pool_size)]
+
+def stop_pool():
+    return [dict(stop_shard(shard), shard=shard) for shard in range(pool_size)]
+
+def pool_command():
+    # Shown by "Generate Command"; start_gost.sh starts the shards through the supervisor
+    commands = [gost_config.gost_command(shard_config_path(shard)) for shard in range(pool_size)]
+    return "\n".join(commands)
@@ -0,0 +1,347 @@
+import json
+import logging
+import os
+import shlex
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+import profiling
+
+logger = logging.getLogger(__name__)
+
+# The supervisor is a small daemon that owns the GOST child processes. API
+# workers and the shell scripts talk to it over a unix socket, so status is
+# answered from its memory instead of forking pgrep, and stop only ever
+# signals PIDs it started itself.
+socket_path = os.environ.get('GOST_SUPERVISOR_SOCKET', 'gost_supervisor.sock')
+log_dir = os.environ.get('GOST_SUPERVISOR_LOG_DIR', 'logs')
+client_timeout = 10
+
+backoff_initial = 1
+backoff_max = 60
+# A child that stayed up this long is considered healthy again
+backoff_reset_after = 30
+stop_timeout = 5
+
+
+class Program:
+    def __init__(self, name, argv):
+        self.name = name
+        self.argv = argv
+        self.process = None
+        self.wanted = False
+        self.started_at = None
+        self.restarts = 0
+        self.backoff = backoff_initial
+        self.next_start = None
+        self.exit_codes = deque(maxlen=10)
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def status(self):
+        running = self.running()
+        return {
+            "name": self.name,
+            "argv": self.argv,
+            "running": running,
+            "pid": self.process.pid if running else None,
+            "uptime": round(time.monotonic() - self.started_at, 3) if running else 0,
+            "restarts": self.restarts,
+            "last_exit_code": self.exit_codes[-1] if self.exit_codes else None,
+            "exit_codes": list(self.exit_codes),
+            "state": "running" if running else ("backoff" if self.wanted else "stopped")
+        }
+
+
+class Supervisor:
+    def __init__(self):
+        self.programs = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def _spawn(self, program):
+        os.makedirs(log_dir, exist_ok=True)
+        log_file = open(os.path.join(log_dir, f"{program.name}.log"), 'ab')
+        try:
+            program.process = subprocess.Popen(program.argv, stdout=log_file, stderr=subprocess.STDOUT,
+                                               stdin=subprocess.DEVNULL, start_new_session=True)
+        finally:
+            log_file.close()
+        program.started_at = time.monotonic()
+        program.next_start = None
+        logger.info(f"Started {program.name} (pid {program.process.pid}): {' '.join(program.argv)}")
+
+    def _terminate(self, program):
+        process = program.process
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout=stop_timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        program.exit_codes.append(process.returncode)
+
+    def start(self, name, argv):
+        with self.lock:
+            program = self.programs.get(name)
+            if program is not None and program.running():
+                if program.argv == argv:
+                    return {"status": "info", "message": f"{name} is already running."}
+                # Same name, new command line: replace the process
+                program.wanted = False
+                self._terminate(program)
+            program = Program(name, argv)
+            program.wanted = True
+            self.programs[name] = program
+            try:
+                self._spawn(program)
+            except OSError as e:
+                program.wanted = False
+                return {"status": "error", "message": f"Failed to start {name}: {e}"}
+            return {"status": "success", "message": f"{name} started."}
+
+    def _wait(self, stopping):
+        # stopping is a list of (program, process) already sent SIGTERM. They share
+        # one deadline, so N programs take at most stop_timeout rather than N times it.
+        deadline = time.monotonic() + stop_timeout
+        for program, process in stopping:
+            try:
+                process.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            with self.lock:
+                program.exit_codes.append(process.returncode)
+
+    def _signal(self, program):
+        # Caller holds self.lock; returns the process to wait for, if any
+        program.wanted = False
+        process = program.process
+        if process is None or process.poll() is not None:
+            return None
+        process.terminate()
+        return process
+
+    def stop(self, name):
+        return self.stop_all([name])[0]
+
+    def stop_all(self, names=None):
+        """Stop the named programs, or all of them, and return one result per name.
+
+        Every program is signalled under the lock, then waited for outside it,
+        so status and control requests are not held up by a slow shutdown.
+        """
+        results = []
+        stopping = []
+        with self.lock:
+            if names is None:
+                names = [name for name, program in self.programs.items() if program.running() or program.wanted]
+            for name in names:
+                program = self.programs.get(name)
+                if program is None or not (program.running() or program.wanted):
+                    results.append({"status": "error", "message": f"{name} is not running.", "name": name})
+                    continue
+                process = self._signal(program)
+                if process is not None:
+                    stopping.append((program, process))
+                results.append({"status": "success", "message": f"{name} stopped.", "name": name})
+        self._wait(stopping)
+        return results
+
+    def status(self):
+        with self.lock:
+            return [program.status() for program in self.programs.values()]
+
+    def check(self):
+        # Reap exited children and restart wanted ones with exponential backoff
+        now = time.monotonic()
+        with self.lock:
+            for program in self.programs.values():
+                process = program.process
+                if process is not None and process.poll() is not None and program.next_start is None and program.wanted:
+                    program.exit_codes.append(process.returncode)
+                    if now - program.started_at >= backoff_reset_after:
+                        program.backoff = backoff_initial
+                    program.next_start = now + program.backoff
+                    logger.warning(f"{program.name} exited with code {process.returncode}, restarting in {program.backoff}s")
+                    program.backoff = min(program.backoff * 2, backoff_max)
+                if program.wanted and program.next_start is not None and now >= program.next_start:
+                    try:
+                        self._spawn(program)
+                        program.restarts += 1
+                    except OSError as e:
+                        logger.error(f"Failed to restart {program.name}: {e}")
+                        program.next_start = now + program.backoff
+
+    def run_monitor(self, interval=0.5):
+        while not self.stopping.wait(interval):
+            self.check()
+
+    def handle(self, request):
+        command = request.get('cmd')
+        if command == 'start':
+            return self.start(request['name'], request['argv'])
+        if command == 'stop':
+            return self.stop(request['name'])
+        if command == 'stop_all':
+            return {"status": "success", "data": self.stop_all()}
+        if command == 'status':
+            return {"status": "success", "data": self.status()}
+        if command == 'ping':
+            return {"status": "success", "pid": os.getpid()}
+        return {"status": "error", "message": f"Unknown command: {command}"}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            response = self.server.supervisor.handle(request)
+        except Exception as e:
+            response = {"status": "error", "message": str(e)}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve():
+    # Refuse to start a second supervisor on the same socket
+    if os.path.exists(socket_path):
+        if ping():
+            print("GOST supervisor is already running.")
+            return
+        os.unlink(socket_path)
+
+    supervisor = Supervisor()
+    server = _Server(socket_path, _RequestHandler)
+    server.supervisor = supervisor
+
+    def shutdown(signum, frame):
+        supervisor.stopping.set()
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    monitor = threading.Thread(target=supervisor.run_monitor, daemon=True)
+    monitor.start()
+    try:
+        server.serve_forever()
+    finally:
+        supervisor.stop_all()
+        server.server_close()
+        try:
+            os.unlink(socket_path)
+        except FileNotFoundError:
+            pass
+
+# ---------------------------------------------------------------------- client
+
+def call(command, **kwargs):
+    request = dict(kwargs, cmd=command)
+    with profiling.span('supervisor', command), socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(client_timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as response:
+            return json.loads(response.readline())
+
+def ping():
+    try:
+        return call('ping')["status"] == "success"
+    except (OSError, ValueError):
+        return False
+
+def ensure_running(timeout=5):
+    """Start the supervisor daemon in the background if nobody answers on the socket."""
+    if ping():
+        return True
+    os.makedirs(log_dir, exist_ok=True)
+    with open(os.path.join(log_dir, 'supervisor.log'), 'ab') as log_file:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), 'serve'], stdout=log_file,
+                         stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if ping():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def gost_programs(saved_command=None):
+    # Imported here because gost_pool imports this module
+    import gost_config
+    import gost_plan
+    import gost_pool
+
+    if gost_config.gost_mode == 'pool':
+        gost_pool.sync_shards()
+        return {gost_pool.shard_program(shard): gost_pool.shard_argv(shard) for shard in range(gost_pool.pool_size)}
+    if gost_config.gost_mode == 'config':
+        gost_config.sync_config()
+        return {"gost": shlex.split(gost_config.gost_command())}
+    if saved_command is None:
+        # The cached launch plan, only re-encoded for listeners that changed
+        current = gost_plan.plan.current()
+        return {"gost": current["argv"]} if current["listeners"] else {}
+    if not saved_command.strip():
+        return {}
+    return {"gost": shlex.split(saved_command)}
+
+def start_gost(saved_command=None):
+    if not ensure_running():
+        return {"status": "error", "message": "GOST supervisor is not running."}
+    programs = gost_programs(saved_command)
+    if not programs:
+        return {"status": "error", "message": "No GOST listeners configured."}
+    results = [dict(call('start', name=name, argv=argv), name=name) for name, argv in programs.items()]
+    if all(result["status"] == "info" for result in results):
+        return {"status": "info", "message": "GOST is already running.", "data": results}
+    if any(result["status"] == "error" for result in results):
+        return {"status": "error", "message": "Failed to start GOST.", "data": results}
+    return {"status": "success", "message": "GOST started successfully.", "data": results}
+
+def stop_gost():
+    if not ping():
+        return {"status": "error", "message": "No GOST processes found."}
+    results = call('stop_all')["data"]
+    if not results:
+        return {"status": "error", "message": "No GOST processes found."}
+    return {"status": "success", "message": "All GOST processes have been terminated.", "data": results}
+
+def gost_status():
+    if not ping():
+        return {"status": "error", "message": "GOST is not running.", "data": []}
+    programs = call('status')["data"]
+    running = [program for program in programs if program["running"]]
+    if running:
+        return {"status": "success", "message": "GOST is running.", "data": programs}
+    return {"status": "error", "message": "GOST is not running.", "data": programs}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    action = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    if action == 'serve':
+        serve()
+    elif action == 'start':
+        # Used by the shell scripts; in command mode this starts the launch plan (see gost_plan.py)
+        print(json.dumps(start_gost(), indent=2))
+    elif action == 'stop':
+        print(json.dumps(stop_gost(), indent=2))
+    elif action == 'status':
+        print(json.dumps(gost_status(), indent=2))
+    else:
+        print(f"Usage: {sys.argv[0]} serve|start|stop|status")
+        sys.exit(2)
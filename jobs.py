@@ -0,0 +1,274 @@
+import fcntl
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+
+# Long-running control operations run on a worker pool and report progress
+# through a job record. Records live in a SQLite database (WAL) so any gunicorn
+# worker can answer a status request for a job started by another worker.
+# Jobs touching the same target (an interface, or "gost") hold an flock on a
+# per-target lock file, so two jobs never run wg-quick on one interface at once.
+jobs_dir = os.environ.get('JOBS_DIR', 'jobs')
+db_path = os.path.join(jobs_dir, 'jobs.db')
+max_workers = int(os.environ.get('JOBS_MAX_WORKERS', '4'))
+default_timeout = float(os.environ.get('JOBS_TIMEOUT', '60'))
+retention = float(os.environ.get('JOBS_RETENTION', str(7 * 24 * 3600)))
+retry_delay = 1
+
+executor = ThreadPoolExecutor(max_workers=max_workers)
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    retries INTEGER NOT NULL DEFAULT 0,
+    timeout REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    target TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started REAL,
+    finished REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    exit_code INTEGER,
+    stdout TEXT,
+    stderr TEXT,
+    result TEXT,
+    pid INTEGER,
+    owner INTEGER,
+    PRIMARY KEY (job_id, target)
+);
+"""
+
+JOB_FIELDS = ('id', 'kind', 'status', 'created', 'started', 'finished', 'retries', 'timeout')
+ITEM_FIELDS = ('target', 'status', 'started', 'finished', 'attempts', 'exit_code', 'stdout', 'stderr', 'result')
+
+
+def connect():
+    global _schema_ready
+    os.makedirs(jobs_dir, exist_ok=True)
+    connection = sqlite3.connect(db_path, timeout=10, isolation_level=None)
+    connection.execute('PRAGMA foreign_keys = ON')
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                connection.execute('PRAGMA journal_mode = WAL')
+                connection.executescript(SCHEMA)
+                columns = [row[1] for row in connection.execute('PRAGMA table_info(job_items)')]
+                if 'owner' not in columns:
+                    # Databases created before items recorded the submitting process
+                    connection.execute('ALTER TABLE job_items ADD COLUMN owner INTEGER')
+                _schema_ready = True
+    return connection
+
+@contextmanager
+def transaction():
+    with closing(connect()) as connection:
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+@contextmanager
+def read_transaction():
+    # Deferred: a consistent snapshot under WAL without taking the writer lock
+    with closing(connect()) as connection:
+        connection.execute('BEGIN')
+        try:
+            yield connection
+        finally:
+            connection.execute('COMMIT')
+
+def lock_path(target):
+    lock_dir = os.path.join(jobs_dir, 'locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', target)
+    return os.path.join(lock_dir, f"{safe_name}.lock")
+
+@contextmanager
+def target_lock(target):
+    with open(lock_path(target), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _find_orphans(connection, job_ids=None):
+    # Items left "running" by a worker process that has since died will never finish,
+    # and neither will "pending" ones queued on the executor of a worker that died
+    query = "SELECT job_id, target, COALESCE(pid, owner) FROM job_items WHERE status IN ('running', 'pending')"
+    params = ()
+    if job_ids:
+        query += f" AND job_id IN ({','.join('?' * len(job_ids))})"
+        params = tuple(job_ids)
+    return [(job_id, target) for job_id, target, pid in connection.execute(query, params)
+            if pid and not _pid_alive(pid)]
+
+def _fail_orphans(job_ids=None):
+    # Looked for with a plain read first, so status polls only take the write lock when there is work
+    with closing(connect()) as connection:
+        if not _find_orphans(connection, job_ids):
+            return
+    with transaction() as connection:
+        for job_id, target in _find_orphans(connection, job_ids):
+            connection.execute(
+                "UPDATE job_items SET status = 'error', finished = ?, stderr = ?, exit_code = NULL "
+                "WHERE job_id = ? AND target = ?",
+                (time.time(), 'Worker process exited before the job finished', job_id, target))
+            _finish_job_if_done(connection, job_id)
+
+def _finish_job_if_done(connection, job_id):
+    pending = connection.execute(
+        "SELECT COUNT(*) FROM job_items WHERE job_id = ? AND finished IS NULL", (job_id,)).fetchone()[0]
+    if pending:
+        return
+    failed = connection.execute(
+        "SELECT COUNT(*) FROM job_items WHERE job_id = ? AND status = 'error'", (job_id,)).fetchone()[0]
+    connection.execute("UPDATE jobs SET status = ?, finished = ? WHERE id = ?",
+                       ('failed' if failed else 'finished', time.time(), job_id))
+
+def _item_output(result):
+    # wg_mgmt/supervisor results carry output, message, error_code and error_message keys
+    success = result.get("status") in ('success', 'warning')
+    exit_code = result.get("error_code", 0 if success else None)
+    stdout = result.get("output") or result.get("message")
+    return exit_code, stdout, result.get("error_message")
+
+
+def submit_batch(kind, targets, func, retries=0, timeout=None):
+    """Run func(target) for every target on the pool and return the job id.
+
+    func returns a result dict with a "status" key, like the wg_mgmt helpers.
+    Errors are retried up to retries times. When timeout is set it is
+    recorded on the job and passed on as func(target, timeout=timeout).
+    """
+    now = time.time()
+    job_id = uuid.uuid4().hex
+    targets = list(dict.fromkeys(targets))
+    with transaction() as connection:
+        connection.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (now - retention,))
+        connection.execute(
+            "INSERT INTO jobs (id, kind, status, created, retries, timeout) VALUES (?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, now, retries, timeout))
+        connection.executemany(
+            "INSERT INTO job_items (job_id, position, target, status, owner) VALUES (?, ?, ?, 'pending', ?)",
+            [(job_id, position, target, os.getpid()) for position, target in enumerate(targets)])
+
+    def run(target):
+        with target_lock(target):
+            with transaction() as connection:
+                started = time.time()
+                connection.execute("UPDATE jobs SET status = 'running', started = COALESCE(started, ?) WHERE id = ?",
+                                   (started, job_id))
+                connection.execute(
+                    "UPDATE job_items SET status = 'running', started = ?, pid = ? WHERE job_id = ? AND target = ?",
+                    (started, os.getpid(), job_id, target))
+            attempts = 0
+            while True:
+                attempts += 1
+                try:
+                    result = func(target, timeout=timeout) if timeout is not None else func(target)
+                except Exception as e:
+                    result = {"status": "error", "error_message": str(e)}
+                if result.get("status") != "error" or attempts > retries:
+                    break
+                time.sleep(retry_delay * attempts)
+
+        exit_code, stdout, stderr = _item_output(result)
+        with transaction() as connection:
+            connection.execute(
+                "UPDATE job_items SET status = ?, finished = ?, attempts = ?, exit_code = ?, stdout = ?, stderr = ?, "
+                "result = ? WHERE job_id = ? AND target = ?",
+                (result.get("status", "error"), time.time(), attempts, exit_code, stdout, stderr,
+                 json.dumps(result, default=str), job_id, target))
+            _finish_job_if_done(connection, job_id)
+
+    for target in targets:
+        executor.submit(run, target)
+    return job_id
+
+def submit(kind, target, func, retries=0, timeout=None):
+    # A single operation is a batch of one
+    return submit_batch(kind, [target], func, retries=retries, timeout=timeout)
+
+
+def _job_from_rows(job_row, item_rows):
+    job = dict(zip(JOB_FIELDS, job_row))
+    job["items"] = {}
+    for item_row in item_rows:
+        item = dict(zip(ITEM_FIELDS, item_row))
+        item["result"] = json.loads(item["result"]) if item["result"] else None
+        item["seconds"] = round(item["finished"] - item["started"], 3) if item["finished"] and item["started"] else None
+        job["items"][item.pop("target")] = item
+    return job
+
+def load_job(job_id):
+    # Job ids are uuid4 hex strings; anything else is not a job
+    if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+        return None
+    _fail_orphans([job_id])
+    with read_transaction() as connection:
+        job_row = connection.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job_row is None:
+            return None
+        item_rows = connection.execute(
+            f"SELECT {', '.join(ITEM_FIELDS)} FROM job_items WHERE job_id = ? ORDER BY position", (job_id,)).fetchall()
+    return _job_from_rows(job_row, item_rows)
+
+def list_jobs(status=None, kind=None, limit=50):
+    """Most recent jobs first, optionally filtered by job status and kind."""
+    conditions = []
+    params = []
+    if status:
+        conditions.append("status = ?")
+        params.append(status)
+    if kind:
+        conditions.append("kind = ?")
+        params.append(kind)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    _fail_orphans()
+    with read_transaction() as connection:
+        job_rows = connection.execute(
+            f"SELECT {', '.join(JOB_FIELDS)} FROM jobs {where} ORDER BY created DESC LIMIT ?",
+            (*params, limit)).fetchall()
+        items = {}
+        for job_row in job_rows:
+            items[job_row[0]] = connection.execute(
+                f"SELECT {', '.join(ITEM_FIELDS)} FROM job_items WHERE job_id = ? ORDER BY position",
+                (job_row[0],)).fetchall()
+    return [_job_from_rows(job_row, items[job_row[0]]) for job_row in job_rows]
+
+def summarize(job):
+    counts = {}
+    for item in job["items"].values():
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+    return dict(job, progress={"total": len(job["items"]), **counts})
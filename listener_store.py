@@ -0,0 +1,745 @@
+import csv
+import errno
+import fcntl
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing, contextmanager
+
+import profiling
+
+logger = logging.getLogger(__name__)
+
+FIELDNAMES = ['id', 'username', 'password', 'port', 'interface']
+
+
+def replace_file(tmp_path, path):
+    """Move tmp_path over path, or copy it into path when path is a mount point.
+
+    The documented docker command bind-mounts single files (parameters.csv,
+    gost_command.txt), and rename(2) onto a mount point fails with EBUSY
+    (EXDEV on some kernels). The in-place copy is not atomic, so the caller
+    must hold the flock its readers take.
+    """
+    try:
+        os.replace(tmp_path, path)
+        return
+    except OSError as e:
+        if e.errno not in (errno.EBUSY, errno.EXDEV):
+            raise
+    # Overwrite from the start and cut off the rest, so the file is never empty
+    with open(tmp_path, 'rb') as source, open(path, 'r+b') as target:
+        shutil.copyfileobj(source, target)
+        target.truncate()
+        target.flush()
+        os.fsync(target.fileno())
+    os.unlink(tmp_path)
+
+
+class ListenerStore:
+    """In-memory view of parameters.csv shared by every gost_mgmt call.
+
+    Rows are indexed by id, by port and by interface (so cascades over one
+    interface touch only its listeners). The file is only re-parsed when its
+    inode, mtime or size changes, so other gunicorn workers' writes are picked
+    up without re-reading it on every request. Writes take an exclusive flock
+    on a sidecar lock file and replace the CSV atomically, or rewrite it in
+    place when it is bind-mounted; re-reads take the flock shared.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self._lock = threading.RLock()
+        self._fieldnames = list(FIELDNAMES)
+        self._rows = {}   # id -> row, in file order
+        self._ports = {}  # port -> id
+        self._by_interface = {}  # interface -> {id: None}, in insertion order
+        self._max_id = 0
+        self._signature = None
+        self._loaded = False
+        self._file_locked = False
+
+    # ------------------------------------------------------------------ loading
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _load(self):
+        rows = {}
+        ports = {}
+        max_id = 0
+        fieldnames = list(FIELDNAMES)
+        try:
+            with profiling.span('file', f"read {self.path}"), open(self.path, 'r', newline='') as csvfile:
+                reader = csv.DictReader(csvfile)
+                if reader.fieldnames:
+                    fieldnames = list(reader.fieldnames)
+                for row in reader:
+                    item_id = row.get('id', '')
+                    rows[item_id] = row
+                    ports[row.get('port', '')] = item_id
+                    if item_id.isdigit():
+                        max_id = max(max_id, int(item_id))
+        except FileNotFoundError:
+            pass
+        for name in FIELDNAMES:
+            if name not in fieldnames:
+                fieldnames.append(name)
+        self._fieldnames = fieldnames
+        self._rows = rows
+        self._ports = ports
+        self._max_id = max_id
+        self._reindex_interfaces()
+
+    def _reindex_interfaces(self):
+        by_interface = {}
+        for item_id, row in self._rows.items():
+            by_interface.setdefault(row.get('interface', ''), {})[item_id] = None
+        self._by_interface = by_interface
+
+    def _index_interface(self, item_id, old_interface, new_interface):
+        if old_interface is not None:
+            ids = self._by_interface.get(old_interface)
+            if ids is not None:
+                ids.pop(item_id, None)
+                if not ids:
+                    del self._by_interface[old_interface]
+        if new_interface is not None:
+            self._by_interface.setdefault(new_interface, {})[item_id] = None
+
+    def _refresh(self):
+        # Caller must hold self._lock
+        signature = self._file_signature()
+        if self._loaded and signature == self._signature:
+            return
+        if self._file_locked:
+            self._load()
+        else:
+            # A bind-mounted CSV is rewritten in place; never parse it halfway through a write
+            with self._file_lock(shared=True):
+                signature = self._file_signature()
+                self._load()
+        self._signature = signature
+        self._loaded = True
+
+    # ------------------------------------------------------------------ writing
+
+    @contextmanager
+    def _file_lock(self, shared=False):
+        # Caller must hold self._lock; flocks on separate opens of the same file block each other
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            self._file_locked = True
+            try:
+                yield
+            finally:
+                self._file_locked = False
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.parameters.', suffix='.tmp', dir=directory)
+        try:
+            with profiling.span('file', f"write {self.path}"), os.fdopen(fd, 'w', newline='') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=self._fieldnames)
+                writer.writeheader()
+                writer.writerows(self._rows.values())
+                csvfile.flush()
+                os.fsync(csvfile.fileno())
+            replace_file(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self._signature = self._file_signature()
+
+    @contextmanager
+    def transaction(self):
+        """Lock the file, bring the cache up to date and write it back on exit."""
+        with self._lock, self._file_lock():
+            self._refresh()
+            try:
+                yield self
+            except BaseException:
+                # Drop any partial in-memory changes
+                self._loaded = False
+                raise
+            self._write()
+
+    # ------------------------------------------------------------------ reads
+
+    def rows(self):
+        with self._lock:
+            self._refresh()
+            return [dict(row) for row in self._rows.values()]
+
+    def get(self, item_id):
+        with self._lock:
+            self._refresh()
+            row = self._rows.get(str(item_id))
+            return dict(row) if row is not None else None
+
+    def iter_rows(self):
+        # Snapshot the row references under the lock, copy each lazily
+        with self._lock:
+            self._refresh()
+            snapshot = list(self._rows.values())
+        for row in snapshot:
+            yield dict(row)
+
+    def port_exists(self, port):
+        with self._lock:
+            self._refresh()
+            return str(port).strip() in self._ports
+
+    def revision(self):
+        # Changes whenever the CSV is rewritten, by this process or another one
+        with self._lock:
+            self._refresh()
+            return list(self._signature) if self._signature else None
+
+    # ------------------------------------------------------------------ mutations
+    # These expect to be called inside transaction()
+
+    def _add_fieldnames(self, keys):
+        # Optional listener fields (e.g. pool) become new CSV columns
+        for key in keys:
+            if key not in self._fieldnames:
+                self._fieldnames.append(key)
+                for row in self._rows.values():
+                    row.setdefault(key, '')
+
+    def _insert(self, row):
+        port = str(row['port']).strip()
+        if port in self._ports:
+            raise ValueError("Port already exists.")
+        self._add_fieldnames(row)
+        self._max_id += 1
+        item_id = str(self._max_id)
+        new_row = {name: '' for name in self._fieldnames}
+        new_row.update({key: str(value) for key, value in row.items()})
+        new_row['id'] = item_id
+        new_row['port'] = port
+        self._rows[item_id] = new_row
+        self._ports[port] = item_id
+        self._index_interface(item_id, None, new_row['interface'])
+        return item_id
+
+    def _update(self, item_id, changes):
+        item_id = str(item_id)
+        row = self._rows.get(item_id)
+        if row is None:
+            raise ValueError("Item with the specified ID not found.")
+        if 'port' in changes:
+            port = str(changes['port']).strip()
+            owner = self._ports.get(port)
+            if owner is not None and owner != item_id:
+                raise ValueError("Port already exists.")
+            # A hand-edited CSV can repeat a port; keep the index entry if it points at the other row
+            if self._ports.get(row['port']) == item_id:
+                del self._ports[row['port']]
+            self._ports[port] = item_id
+            changes = dict(changes, port=port)
+        self._add_fieldnames(changes)
+        old_interface = row['interface']
+        row.update({key: str(value) for key, value in changes.items()})
+        if row['interface'] != old_interface:
+            self._index_interface(item_id, old_interface, row['interface'])
+
+    def _renumber(self):
+        rows = {}
+        ports = {}
+        for i, row in enumerate(self._rows.values(), start=1):
+            row['id'] = str(i)
+            rows[row['id']] = row
+            ports[row['port']] = row['id']
+        self._rows = rows
+        self._ports = ports
+        self._max_id = len(rows)
+        self._reindex_interfaces()
+
+    # ------------------------------------------------------------------ public mutations
+
+    def add(self, row):
+        with self.transaction():
+            return self._insert(row)
+
+    def add_many(self, rows, atomic=True):
+        """Insert (line, row) pairs with a single write.
+
+        Returns (added_ids, errors). With atomic=True nothing is written if
+        any row is rejected.
+        """
+        with self._lock, self._file_lock():
+            self._refresh()
+            added = []
+            errors = []
+            for line, row in rows:
+                try:
+                    added.append(self._insert(row))
+                except ValueError as e:
+                    errors.append({"line": line, "error": str(e)})
+            if errors and atomic:
+                self._loaded = False
+                return [], errors
+            if added:
+                self._write()
+            return added, errors
+
+    def update(self, item_id, changes):
+        with self.transaction():
+            self._update(item_id, changes)
+
+    def remove(self, item_id):
+        with self.transaction():
+            row = self._rows.pop(str(item_id), None)
+            if row is not None:
+                self._ports.pop(row['port'], None)
+                self._index_interface(str(item_id), row['interface'], None)
+            # Keep ids sequential, matching cleanup_csv_ids()
+            self._renumber()
+            return row is not None
+
+    def renumber(self):
+        with self.transaction():
+            self._renumber()
+
+    def listener_ids(self, interface):
+        # O(k) in the interface's listeners; sorted by id like the SQLite backend
+        with self._lock:
+            self._refresh()
+            return sorted(self._by_interface.get(interface, ()), key=lambda item_id: (len(item_id), item_id))
+
+    def rows_for_interface(self, interface):
+        with self._lock:
+            return [dict(self._rows[item_id]) for item_id in self.listener_ids(interface)]
+
+    def replace_interface(self, old_interface, new_interface, ports=None):
+        """Point old_interface's listeners (only those on ports, if given) at new_interface."""
+        with self.transaction():
+            changed = 0
+            for item_id in list(self._by_interface.get(old_interface, ())):
+                row = self._rows[item_id]
+                if ports is not None and row['port'] not in ports:
+                    continue
+                row['interface'] = new_interface
+                self._index_interface(item_id, old_interface, new_interface)
+                changed += 1
+            return changed
+
+    # ------------------------------------------------------------------ interface metadata
+    # Kept in a JSON file next to the CSV, under the same lock
+
+    def _metadata_path(self):
+        return f"{self.path}.interfaces.json"
+
+    def _read_metadata(self):
+        try:
+            with profiling.span('file', f"read {self._metadata_path()}"), open(self._metadata_path()) as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def interface_metadata(self, name):
+        return self._read_metadata().get(name, {})
+
+    def all_interface_metadata(self):
+        return self._read_metadata()
+
+    def update_interface_metadata(self, name, changes):
+        with self._lock, self._file_lock():
+            metadata = self._read_metadata()
+            metadata[name] = dict(metadata.get(name, {}), **changes)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(prefix='.interfaces.', suffix='.tmp', dir=directory)
+            try:
+                with profiling.span('file', f"write {self._metadata_path()}"), os.fdopen(fd, 'w') as file:
+                    json.dump(metadata, file)
+                os.replace(tmp_path, self._metadata_path())
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except FileNotFoundError:
+                    pass
+                raise
+            return metadata[name]
+
+
+class SQLiteListenerStore:
+    """Listener storage in SQLite (WAL), with the same interface as ListenerStore.
+
+    The port is a unique index and the interface is indexed, so lookups and
+    interface-wide updates do not scan every row. Ids are stable: removing a
+    listener does not renumber the others. Fields outside FIELDNAMES are kept
+    in a JSON column so rows round-trip like CSV columns.
+
+    On first use an existing CSV is imported once, keeping its ids. With
+    export_csv_path set, every write also rewrites that CSV for tools that
+    still read parameters.csv.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS listeners (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL DEFAULT '',
+        password TEXT NOT NULL DEFAULT '',
+        port TEXT NOT NULL,
+        interface TEXT NOT NULL DEFAULT '',
+        extra TEXT NOT NULL DEFAULT '{}'
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS listeners_port ON listeners (port);
+    CREATE INDEX IF NOT EXISTS listeners_interface ON listeners (interface);
+    CREATE TABLE IF NOT EXISTS interfaces (
+        name TEXT PRIMARY KEY,
+        metadata TEXT NOT NULL DEFAULT '{}'
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    """
+
+    COLUMNS = ('username', 'password', 'port', 'interface')
+
+    def __init__(self, path, csv_path=None, export_csv_path=None):
+        self.path = path
+        self.csv_path = csv_path
+        self.export_csv_path = export_csv_path
+        self._lock = threading.RLock()
+        self._ready = False
+        self._loaded = False
+        self._version = None
+        self._rows = {}
+        self._ports = {}
+        self._fieldnames = list(FIELDNAMES)
+        self._patches = None
+
+    # ------------------------------------------------------------------ connections
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    connection.execute('PRAGMA journal_mode = WAL')
+                    connection.executescript(self.SCHEMA)
+                    self._migrate_csv(connection)
+                    self._ready = True
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        """One write transaction; bumps the version so other processes reload.
+
+        This process reloads too, unless every change in the transaction was
+        registered with _patch_cache() and nobody else wrote since the last
+        load; then the cached rows are updated in place instead.
+        """
+        with self._lock, profiling.span('sqlite', f"write transaction {self.path}"), \
+                closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            self._patches = None
+            try:
+                before = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+                yield connection
+                connection.execute(
+                    "INSERT INTO meta (key, value) VALUES ('version', '1') "
+                    "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+                after = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            except BaseException:
+                self._patches = None
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+            patches, self._patches = self._patches, None
+            if self._loaded and before == self._version and patches is not None:
+                for patch in patches:
+                    patch()
+                self._version = after
+            else:
+                self._loaded = False
+            if self.export_csv_path:
+                self._refresh(connection)
+                self._export_csv(self.export_csv_path)
+
+    def _migrate_csv(self, connection):
+        # One-time import of the CSV; the marker stops it from running again
+        done = connection.execute("SELECT 1 FROM meta WHERE key = 'migrated_csv'").fetchone()
+        if done or not self.csv_path or not os.path.exists(self.csv_path):
+            return
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # Another worker starting at the same time may have imported it while we waited
+            if connection.execute("SELECT 1 FROM meta WHERE key = 'migrated_csv'").fetchone():
+                connection.execute('ROLLBACK')
+                return
+            skipped = []
+            with open(self.csv_path, 'r', newline='') as csvfile:
+                reader = csv.DictReader(csvfile)
+                for row in reader:
+                    item_id = row.get('id', '')
+                    params = self._params(row)
+                    if item_id.isdigit():
+                        cursor = connection.execute(
+                            "INSERT OR IGNORE INTO listeners (id, username, password, port, interface, extra) "
+                            "VALUES (?, ?, ?, ?, ?, ?)", (int(item_id), *params))
+                    else:
+                        cursor = connection.execute(
+                            "INSERT OR IGNORE INTO listeners (username, password, port, interface, extra) "
+                            "VALUES (?, ?, ?, ?, ?)", params)
+                    if cursor.rowcount == 0:
+                        # The table keeps ids and ports unique; the CSV file does not
+                        skipped.append(row)
+                        logger.warning(f"Not migrating listener id={item_id} port={params[2]} "
+                                       f"interface={params[3]}: duplicate id or port")
+            if skipped:
+                # parameters.csv may be rewritten from the database later, so keep them aside
+                skipped_path = f"{self.csv_path}.skipped"
+                with open(skipped_path, 'w', newline='') as file:
+                    writer = csv.DictWriter(file, fieldnames=reader.fieldnames, extrasaction='ignore')
+                    writer.writeheader()
+                    writer.writerows(skipped)
+                logger.error(f"{len(skipped)} listener(s) in {self.csv_path} have a duplicate id or port and "
+                             f"were not migrated; they were saved to {skipped_path}")
+            connection.execute("INSERT INTO meta (key, value) VALUES ('migrated_csv', ?)", (self.csv_path,))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    # ------------------------------------------------------------------ loading
+
+    def _params(self, row):
+        extra = {key: str(value) for key, value in row.items() if key not in FIELDNAMES and key is not None}
+        return (str(row.get('username', '')), str(row.get('password', '')), str(row.get('port', '')).strip(),
+                str(row.get('interface', '')), json.dumps(extra))
+
+    def _refresh(self, connection):
+        # Caller must hold self._lock; reload only when another write bumped the version
+        version = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if self._loaded and version == self._version:
+            return
+        rows = {}
+        ports = {}
+        fieldnames = list(FIELDNAMES)
+        with profiling.span('sqlite', f"read listeners {self.path}"):
+            listeners = connection.execute(
+                "SELECT id, username, password, port, interface, extra FROM listeners ORDER BY id").fetchall()
+        for item_id, username, password, port, interface, extra in listeners:
+            row = {'id': str(item_id), 'username': username, 'password': password, 'port': port, 'interface': interface}
+            for key, value in json.loads(extra).items():
+                if key not in fieldnames:
+                    fieldnames.append(key)
+                row[key] = value
+            rows[row['id']] = row
+            ports[port] = row['id']
+        for row in rows.values():
+            for name in fieldnames:
+                row.setdefault(name, '')
+        self._rows = rows
+        self._ports = ports
+        self._fieldnames = fieldnames
+        self._version = version
+        self._loaded = True
+
+    def _cached(self):
+        with self._lock, closing(self._connect()) as connection:
+            self._refresh(connection)
+            return self._rows, self._ports
+
+    def _export_csv(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.parameters.', suffix='.tmp', dir=directory)
+        try:
+            with profiling.span('file', f"write {path}"), os.fdopen(fd, 'w', newline='') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=self._fieldnames)
+                writer.writeheader()
+                writer.writerows(self._rows.values())
+            # The lock ListenerStore takes on the same CSV; a bind-mounted file is rewritten in place
+            with open(f"{path}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                replace_file(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def export_csv(self, path=None):
+        """Write the listeners to a CSV in the ListenerStore format."""
+        with self._lock, closing(self._connect()) as connection:
+            self._refresh(connection)
+            self._export_csv(path or self.export_csv_path or self.csv_path)
+
+    # ------------------------------------------------------------------ reads
+
+    def rows(self):
+        rows, _ = self._cached()
+        return [dict(row) for row in rows.values()]
+
+    def get(self, item_id):
+        rows, _ = self._cached()
+        row = rows.get(str(item_id))
+        return dict(row) if row is not None else None
+
+    def iter_rows(self):
+        rows, _ = self._cached()
+        for row in list(rows.values()):
+            yield dict(row)
+
+    def port_exists(self, port):
+        _, ports = self._cached()
+        return str(port).strip() in ports
+
+    def revision(self):
+        # The version counter bumped by every write transaction; the inode tells a recreated database apart
+        with closing(self._connect()) as connection:
+            found = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return [os.stat(self.path).st_ino, int(found[0]) if found else 0]
+
+    def listener_ids(self, interface):
+        with closing(self._connect()) as connection:
+            return [str(item_id) for (item_id,) in
+                    connection.execute("SELECT id FROM listeners WHERE interface = ? ORDER BY id", (interface,))]
+
+    def rows_for_interface(self, interface):
+        # Served by the interface index
+        with closing(self._connect()) as connection:
+            ids = [str(item_id) for (item_id,) in
+                   connection.execute("SELECT id FROM listeners WHERE interface = ? ORDER BY id", (interface,))]
+        rows, _ = self._cached()
+        return [dict(rows[item_id]) for item_id in ids if item_id in rows]
+
+    # ------------------------------------------------------------------ mutations
+
+    def _insert(self, connection, row):
+        try:
+            cursor = connection.execute(
+                "INSERT INTO listeners (username, password, port, interface, extra) VALUES (?, ?, ?, ?, ?)",
+                self._params(row))
+        except sqlite3.IntegrityError:
+            raise ValueError("Port already exists.")
+        return str(cursor.lastrowid)
+
+    def add(self, row):
+        with self.transaction() as connection:
+            return self._insert(connection, row)
+
+    def add_many(self, rows, atomic=True):
+        """Insert (line, row) pairs in one transaction; see ListenerStore.add_many."""
+        added = []
+        errors = []
+        try:
+            with self.transaction() as connection:
+                for line, row in rows:
+                    try:
+                        added.append(self._insert(connection, row))
+                    except ValueError as e:
+                        errors.append({"line": line, "error": str(e)})
+                if errors and atomic:
+                    raise _Rollback()
+        except _Rollback:
+            return [], errors
+        return added, errors
+
+    def update(self, item_id, changes):
+        with self.transaction() as connection:
+            found = connection.execute(
+                "SELECT username, password, port, interface, extra FROM listeners WHERE id = ?",
+                (int(item_id) if str(item_id).isdigit() else -1,)).fetchone()
+            if found is None:
+                raise ValueError("Item with the specified ID not found.")
+            row = dict(zip(self.COLUMNS, found[:4]), **json.loads(found[4]))
+            row.update({key: str(value) for key, value in changes.items() if key != 'id'})
+            try:
+                connection.execute(
+                    "UPDATE listeners SET username = ?, password = ?, port = ?, interface = ?, extra = ? WHERE id = ?",
+                    (*self._params(row), int(item_id)))
+            except sqlite3.IntegrityError:
+                raise ValueError("Port already exists.")
+
+    def remove(self, item_id):
+        if not str(item_id).isdigit():
+            return False
+        with self.transaction() as connection:
+            # Ids stay stable; nothing is renumbered
+            return connection.execute("DELETE FROM listeners WHERE id = ?", (int(item_id),)).rowcount > 0
+
+    def renumber(self):
+        # Ids are stable in SQLite; kept so callers work with either backend
+        return None
+
+    def _patch_cache(self, patch):
+        # Inside transaction(): apply patch to the cached rows after commit instead of reloading them all
+        if self._patches is None:
+            self._patches = []
+        self._patches.append(patch)
+
+    def replace_interface(self, old_interface, new_interface, ports=None):
+        ports = None if ports is None else {str(port) for port in ports}
+        with self.transaction() as connection:
+            # Served by the interface index, so this touches only the interface's listeners
+            ids = [str(item_id) for item_id, port in connection.execute(
+                       "SELECT id, port FROM listeners WHERE interface = ?", (old_interface,))
+                   if ports is None or port in ports]
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                connection.execute(
+                    f"UPDATE listeners SET interface = ? WHERE id IN ({','.join('?' * len(chunk))})",
+                    (new_interface, *chunk))
+
+            def patch():
+                for item_id in ids:
+                    if item_id in self._rows:
+                        self._rows[item_id]['interface'] = new_interface
+            self._patch_cache(patch)
+            return len(ids)
+
+    # ------------------------------------------------------------------ interface metadata
+
+    def interface_metadata(self, name):
+        with closing(self._connect()) as connection:
+            found = connection.execute("SELECT metadata FROM interfaces WHERE name = ?", (name,)).fetchone()
+        return json.loads(found[0]) if found else {}
+
+    def all_interface_metadata(self):
+        with closing(self._connect()) as connection:
+            return {name: json.loads(metadata) for name, metadata in
+                    connection.execute("SELECT name, metadata FROM interfaces ORDER BY name")}
+
+    def update_interface_metadata(self, name, changes):
+        with self.transaction() as connection:
+            found = connection.execute("SELECT metadata FROM interfaces WHERE name = ?", (name,)).fetchone()
+            metadata = dict(json.loads(found[0]) if found else {}, **changes)
+            connection.execute(
+                "INSERT INTO interfaces (name, metadata) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET metadata = excluded.metadata", (name, json.dumps(metadata)))
+            # The listener rows did not change
+            self._patch_cache(lambda: None)
+            return metadata
+
+
+class _Rollback(Exception):
+    pass
+
+
+def open_store(backend, csv_path, db_path=None, export_csv=False):
+    """Build the listener store for the configured backend ('csv' or 'sqlite')."""
+    if backend == 'sqlite':
+        return SQLiteListenerStore(db_path, csv_path=csv_path, export_csv_path=csv_path if export_csv else None)
+    if backend == 'csv':
+        return ListenerStore(csv_path)
+    raise ValueError(f"Unknown listener store backend: {backend}")
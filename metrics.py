@@ -0,0 +1,280 @@
+import atexit
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from bisect import bisect_left
+from contextlib import closing
+
+import gost_config
+import gost_mgmt
+import gost_pool
+import wg_inventory
+
+logger = logging.getLogger(__name__)
+
+# Scrapes are answered from a pre-rendered snapshot refreshed in the background
+refresh_interval = float(os.environ.get('METRICS_INTERVAL', '15'))
+scrape_timeout = 2
+
+# Request latency is counted in every gunicorn worker and added up in SQLite,
+# so whichever worker answers a scrape reports the same cumulative series
+latency_db_path = os.environ.get('METRICS_DB', 'metrics.db')
+flush_interval = 5
+
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+tcp_tables = ('/proc/net/tcp', '/proc/net/tcp6')
+TCP_ESTABLISHED = '01'
+
+GOST_SAMPLE = re.compile(r'^(gost_service_\w+)\{([^}]*)\}\s+(\S+)')
+GOST_LABEL = re.compile(r'(\w+)="([^"]*)"')
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    return ','.join(f'{key}="{escape_label(value)}"' for key, value in labels.items())
+
+
+class RequestHistogram:
+    """Per-route Flask request latency, shared by all worker processes.
+
+    observe() only touches this process's pending counts; a background thread
+    adds them to the shared database every flush_interval seconds.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or latency_db_path
+        self._lock = threading.Lock()
+        self._pending = {}  # (route, method) -> [bucket counts..., +Inf count, sum]
+        self._thread = None
+
+    def observe(self, route, method, seconds):
+        index = bisect_left(latency_buckets, seconds)
+        with self._lock:
+            series = self._pending.get((route, method))
+            if series is None:
+                series = self._pending[(route, method)] = [0] * (len(latency_buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        connection.execute('PRAGMA journal_mode = WAL')
+        # bucket len(latency_buckets) is +Inf, the one after it holds the sum
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS request_latency (route TEXT NOT NULL, method TEXT NOT NULL, "
+            "bucket INTEGER NOT NULL, value REAL NOT NULL, PRIMARY KEY (route, method, bucket))")
+        return connection
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        values = [(route, method, bucket, value)
+                  for (route, method), series in pending.items()
+                  for bucket, value in enumerate(series) if value]
+        try:
+            with closing(self._connect()) as connection:
+                connection.execute('BEGIN IMMEDIATE')
+                connection.executemany(
+                    "INSERT INTO request_latency (route, method, bucket, value) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (route, method, bucket) DO UPDATE SET value = value + excluded.value", values)
+                connection.execute('COMMIT')
+        except sqlite3.Error as e:
+            logger.error(f"Failed to record request latency: {e}")
+            # Keep the counts for the next flush
+            with self._lock:
+                for key, series in pending.items():
+                    current = self._pending.setdefault(key, [0] * (len(latency_buckets) + 1) + [0.0])
+                    for bucket, value in enumerate(series):
+                        current[bucket] += value
+
+    def _run(self):
+        while True:
+            time.sleep(flush_interval)
+            self.flush()
+
+    def render(self):
+        self.flush()
+        series = {}
+        try:
+            with closing(self._connect()) as connection:
+                for route, method, bucket, value in connection.execute(
+                        "SELECT route, method, bucket, value FROM request_latency"):
+                    counts = series.setdefault((route, method), [0] * (len(latency_buckets) + 1) + [0.0])
+                    if bucket < len(counts):
+                        counts[bucket] = value
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read request latency: {e}")
+        lines = [
+            '# HELP flask_request_duration_seconds API request latency by route.',
+            '# TYPE flask_request_duration_seconds histogram'
+        ]
+        for (route, method), counts in sorted(series.items()):
+            labels = {"route": route, "method": method}
+            cumulative = 0
+            for bound, count in zip(latency_buckets + ('+Inf',), counts[:-1]):
+                cumulative += int(count)
+                lines.append(f'flask_request_duration_seconds_bucket{{{format_labels(dict(labels, le=bound))}}} {cumulative}')
+            lines.append(f'flask_request_duration_seconds_sum{{{format_labels(labels)}}} {counts[-1]}')
+            lines.append(f'flask_request_duration_seconds_count{{{format_labels(labels)}}} {cumulative}')
+        return lines
+
+
+def established_connections(ports):
+    # Count ESTABLISHED sockets by local port straight from the kernel tables
+    counts = dict.fromkeys(ports, 0)
+    for table in tcp_tables:
+        try:
+            with open(table) as file:
+                next(file, None)
+                for line in file:
+                    fields = line.split()
+                    if len(fields) < 4 or fields[3] != TCP_ESTABLISHED:
+                        continue
+                    port = int(fields[1].rsplit(':', 1)[1], 16)
+                    if port in counts:
+                        counts[port] += 1
+        except OSError:
+            continue
+    return counts
+
+def gost_metrics_addresses():
+    if gost_config.gost_mode == 'pool':
+        return [gost_pool.shard_metrics_addr(shard) for shard in range(gost_pool.pool_size)]
+    if gost_config.gost_mode == 'config':
+        return [gost_config.metrics_addr]
+    # The single command-line GOST has no metrics exporter enabled
+    return []
+
+def gost_service_samples():
+    # {port: {metric name: value}} summed across GOST's own series
+    samples = {}
+    for address in gost_metrics_addresses():
+        try:
+            with urllib.request.urlopen(f"http://{address}/metrics", timeout=scrape_timeout) as response:
+                body = response.read().decode('utf-8', 'replace')
+        except (urllib.error.URLError, OSError):
+            continue
+        for line in body.splitlines():
+            match = GOST_SAMPLE.match(line)
+            if not match:
+                continue
+            name, labels, value = match.groups()
+            service = dict(GOST_LABEL.findall(labels)).get('service', '')
+            if not service.startswith('service-'):
+                continue
+            port = service[len('service-'):]
+            metrics = samples.setdefault(port, {})
+            try:
+                metrics[name] = metrics.get(name, 0.0) + float(value)
+            except ValueError:
+                continue
+    return samples
+
+def read_counter(interface, counter):
+    try:
+        with open(os.path.join(wg_inventory.sysfs_net_path, interface, 'statistics', counter)) as file:
+            return int(file.read())
+    except (OSError, ValueError):
+        return None
+
+
+def render_listener_metrics():
+    rows = gost_mgmt.store.rows()
+    ports = {int(row['port']) for row in rows if row['port'].isdigit()}
+    connections = established_connections(ports)
+    gost_samples = gost_service_samples()
+
+    lines = [
+        '# HELP gost_listener_active_connections Established TCP connections on the listener port.',
+        '# TYPE gost_listener_active_connections gauge'
+    ]
+    bytes_in = ['# HELP gost_listener_bytes_in_total Bytes received by the listener (GOST config/pool mode only).',
+                '# TYPE gost_listener_bytes_in_total counter']
+    bytes_out = ['# HELP gost_listener_bytes_out_total Bytes sent by the listener (GOST config/pool mode only).',
+                 '# TYPE gost_listener_bytes_out_total counter']
+    for row in rows:
+        labels = format_labels({"id": row['id'], "port": row['port'], "interface": row['interface']})
+        if row['port'].isdigit():
+            lines.append(f'gost_listener_active_connections{{{labels}}} {connections[int(row["port"])]}')
+        samples = gost_samples.get(row['port'])
+        if samples:
+            if 'gost_service_transfer_input_bytes_total' in samples:
+                bytes_in.append(f'gost_listener_bytes_in_total{{{labels}}} {samples["gost_service_transfer_input_bytes_total"]}')
+            if 'gost_service_transfer_output_bytes_total' in samples:
+                bytes_out.append(f'gost_listener_bytes_out_total{{{labels}}} {samples["gost_service_transfer_output_bytes_total"]}')
+    return lines + bytes_in + bytes_out
+
+def render_wireguard_metrics():
+    configured = wg_inventory.inventory.config_names()
+    active = set(wg_inventory.inventory.active_interfaces())
+    lines = [
+        '# HELP wireguard_interface_up Whether the configured WireGuard interface is up.',
+        '# TYPE wireguard_interface_up gauge'
+    ]
+    for name in configured:
+        lines.append(f'wireguard_interface_up{{interface="{name}"}} {1 if name in active else 0}')
+    for counter in ('rx_bytes', 'tx_bytes', 'rx_packets', 'tx_packets', 'rx_errors', 'tx_errors'):
+        metric = f'wireguard_interface_{counter}_total'
+        lines.append(f'# TYPE {metric} counter')
+        for name in sorted(active, key=wg_inventory.interface_sort_key):
+            value = read_counter(name, counter)
+            if value is not None:
+                lines.append(f'{metric}{{interface="{name}"}} {value}')
+    return lines
+
+
+class MetricsSnapshot:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._text = ''
+        self._thread = None
+        self.histogram = RequestHistogram()
+
+    def refresh(self):
+        started = time.monotonic()
+        lines = []
+        for section in (render_listener_metrics, render_wireguard_metrics):
+            try:
+                lines.extend(section())
+            except Exception as e:
+                logger.error(f"Failed to collect {section.__name__}: {e}")
+        lines.extend(self.histogram.render())
+        lines.append('# TYPE webui_metrics_refresh_seconds gauge')
+        lines.append(f'webui_metrics_refresh_seconds {time.monotonic() - started:.6f}')
+        text = '\n'.join(lines) + '\n'
+        with self._lock:
+            self._text = text
+
+    def _run(self):
+        while True:
+            time.sleep(refresh_interval)
+            self.refresh()
+
+    def text(self):
+        # The first scrape in a worker renders synchronously and starts the refresher
+        if self._thread is None:
+            with self._lock:
+                start = self._thread is None
+                if start:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+            if start:
+                self.refresh()
+                self._thread.start()
+        return self._text
+
+
+snapshot = MetricsSnapshot()
@@ -0,0 +1,158 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs
+
+# Opt-in request profiling (PROFILING=1). Each request handled by the Flask
+# app gets a trace; span() records how long each subprocess call and file
+# read/write inside it took. Requests slower than slow_threshold are kept,
+# with their spans, for /api/debug/slow_requests. When PROFILING is off,
+# span() hands back one shared no-op object and nothing else is installed.
+enabled = os.environ.get('PROFILING', '0').lower() in ('1', 'true', 'yes')
+slow_threshold = float(os.environ.get('PROFILING_SLOW_MS', '200')) / 1000
+max_slow_requests = 100
+# Bulk operations can make thousands of calls; only the first ones are kept
+max_spans = 200
+profile_lines = 40
+
+_local = threading.local()
+_slow_lock = threading.Lock()
+slow_requests = deque(maxlen=max_slow_requests)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_null_span = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('trace', 'kind', 'detail', 'started')
+
+    def __init__(self, trace, kind, detail):
+        self.trace = trace
+        self.kind = kind
+        self.detail = detail
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        finished = time.perf_counter()
+        trace = self.trace
+        trace["span_count"] += 1
+        if len(trace["spans"]) < max_spans:
+            trace["spans"].append({
+                "kind": self.kind,
+                "detail": self.detail,
+                "start_ms": round((self.started - trace["started"]) * 1000, 3),
+                "ms": round((finished - self.started) * 1000, 3),
+                "error": exc_info[0].__name__ if exc_info[0] else None
+            })
+        return False
+
+
+def span(kind, detail=''):
+    """Time a block as part of the current request: `with profiling.span('subprocess', 'wg show'):`."""
+    if not enabled:
+        return _null_span
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        # Background threads (jobs, pollers) have no request to attach to
+        return _null_span
+    return _Span(trace, kind, detail)
+
+
+def start_request(method, path):
+    _local.trace = {"method": method, "path": path, "started": time.perf_counter(), "spans": [], "span_count": 0}
+
+def finish_request(route, status):
+    """Close the current trace; keep it if the request was slow."""
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return None
+    _local.trace = None
+    seconds = time.perf_counter() - trace["started"]
+    if seconds < slow_threshold:
+        return None
+    totals = {}
+    for recorded in trace["spans"]:
+        totals[recorded["kind"]] = round(totals.get(recorded["kind"], 0) + recorded["ms"], 3)
+    entry = {
+        "time": time.time(),
+        "worker": os.getpid(),
+        "method": trace["method"],
+        "path": trace["path"],
+        "route": route,
+        "status": status,
+        "ms": round(seconds * 1000, 3),
+        "span_count": trace["span_count"],
+        "span_ms": totals,
+        "spans": trace["spans"]
+    }
+    with _slow_lock:
+        slow_requests.append(entry)
+    return entry
+
+def recent_slow_requests(limit=None):
+    # Newest first; every worker process keeps its own list
+    with _slow_lock:
+        entries = list(slow_requests)
+    entries.reverse()
+    return entries[:limit] if limit else entries
+
+
+class ProfilerMiddleware:
+    """WSGI middleware: `?_profile=1` on any route runs that request under
+    cProfile and answers with the top functions by cumulative time instead of
+    the normal response. `&_sort=tottime` changes the ordering."""
+
+    def __init__(self, app, skip_paths=()):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    def __call__(self, environ, start_response):
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        if query.get('_profile', ['0'])[0] not in ('1', 'true', 'yes') or environ.get('PATH_INFO') in self.skip_paths:
+            return self.app(environ, start_response)
+
+        status_line = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            status_line["status"] = status
+            return lambda data: None
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            result = self.app(environ, capture_start_response)
+            try:
+                for _ in result:
+                    pass
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            profiler.disable()
+        elapsed = time.perf_counter() - started
+
+        sort = query.get('_sort', ['cumulative'])[0]
+        if sort not in ('cumulative', 'tottime', 'ncalls'):
+            sort = 'cumulative'
+        output = io.StringIO()
+        output.write(f"{environ.get('REQUEST_METHOD')} {environ.get('PATH_INFO')} -> "
+                     f"{status_line.get('status')} in {elapsed * 1000:.1f} ms\n\n")
+        pstats.Stats(profiler, stream=output).strip_dirs().sort_stats(sort).print_stats(profile_lines)
+        body = output.getvalue().encode('utf-8')
+        start_response('200 OK', [('Content-Type', 'text/plain; charset=utf-8'), ('Content-Length', str(len(body)))])
+        return [body]
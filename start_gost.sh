@@ -1,11 +1,5 @@
 #!/bin/bash
 
-# Define the command to start gost
-gost_command=$(cat gost_command.txt)
-
-# Start the gost command in a screen session
-screen -dmS gost_autostart bash -c "$gost_command"
-
-# Print a message indicating that gost has been started
-echo "gost_autostart screen session has been started with the following command:"
-echo "$gost_command"
+# Start the saved gost command (or the rendered config/shards in config/pool mode)
+# under the GOST supervisor instead of a screen session
+python3 gost_supervisor.py start
@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import gost_config
+import gost_mgmt
+import gost_plan
+import gost_pool
+import gost_supervisor
+import wg_mgmt
+
+logger = logging.getLogger(__name__)
+
+# Container start-up: bring the saved WireGuard interfaces up concurrently and
+# start each GOST program as soon as the interfaces it routes through are done.
+active_interfaces_file = 'active_interfaces.txt'
+report_path = 'startup_report.json'
+max_parallel = int(os.environ.get('WG_STARTUP_PARALLELISM', '8'))
+interface_timeout = float(os.environ.get('WG_STARTUP_TIMEOUT', '30'))
+
+
+def read_active_interfaces(path=active_interfaces_file):
+    try:
+        with open(path) as file:
+            return [line.strip() for line in file if line.strip()]
+    except FileNotFoundError:
+        logger.error(f"{path} not found.")
+        return []
+
+def current_launch_plan():
+    # The plan is kept up to date by the API, but the listeners may have been edited while it was down
+    if gost_plan.plan.is_stale():
+        print("GOST launch plan is stale, rebuilding it.", flush=True)
+        return gost_plan.plan.rebuild()
+    return gost_plan.plan.current()
+
+def gost_dependencies(saved_command):
+    # program name -> interfaces its listeners egress through
+    if gost_config.gost_mode == 'pool':
+        shards = gost_pool.partition(gost_mgmt.store.rows())
+        return {gost_pool.shard_program(shard): {name for row in rows for name in gost_mgmt.egress_interfaces(row)}
+                for shard, rows in enumerate(shards)}
+    if gost_config.gost_mode == 'config':
+        return {"gost": {name for row in gost_mgmt.store.rows() for name in gost_mgmt.egress_interfaces(row)}}
+    return {"gost": set(re.findall(r'interface=([^\s&]+)', saved_command or ''))}
+
+def bring_up(interface_name):
+    started = time.monotonic()
+    result = wg_mgmt.bring_interface_up(interface_name, timeout=interface_timeout)
+    return {
+        "interface": interface_name,
+        "status": result["status"],
+        "seconds": round(time.monotonic() - started, 3),
+        "error": result.get("error_message")
+    }
+
+
+def run(start_gost=True):
+    started = time.monotonic()
+    interfaces = read_active_interfaces()
+    report = {"interfaces": [], "gost": []}
+
+    programs = {}
+    waiting_on = {}
+    if start_gost:
+        saved_command = current_launch_plan()["command"] if gost_config.gost_mode == 'command' else None
+        if gost_supervisor.ensure_running():
+            programs = gost_supervisor.gost_programs()
+        else:
+            logger.error("GOST supervisor did not start; GOST will not be started.")
+        dependencies = gost_dependencies(saved_command)
+        # Only wait for interfaces we are actually bringing up here
+        waiting_on = {name: dependencies.get(name, set()) & set(interfaces) for name in programs}
+
+    def start_ready_programs():
+        for name in [name for name, pending in waiting_on.items() if not pending]:
+            del waiting_on[name]
+            result = gost_supervisor.call('start', name=name, argv=programs[name])
+            elapsed = round(time.monotonic() - started, 3)
+            report["gost"].append({"program": name, "status": result["status"], "started_after": elapsed})
+            print(f"Started GOST program {name} after {elapsed}s: {result['message']}", flush=True)
+
+    start_ready_programs()
+
+    with ThreadPoolExecutor(max_workers=max(1, max_parallel)) as pool:
+        futures = {pool.submit(bring_up, name): name for name in interfaces}
+        for future in as_completed(futures):
+            result = future.result()
+            report["interfaces"].append(result)
+            if result["status"] == "success":
+                print(f"Brought up {result['interface']} in {result['seconds']}s", flush=True)
+            else:
+                print(f"Failed to bring up {result['interface']} after {result['seconds']}s: {result['error']}", flush=True)
+            # GOST starts even if an interface failed; its listeners will just not egress
+            for pending in waiting_on.values():
+                pending.discard(result["interface"])
+            start_ready_programs()
+
+    report["seconds"] = round(time.monotonic() - started, 3)
+    with open(report_path, 'w') as file:
+        json.dump(report, file, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    report = run(start_gost='--no-gost' not in sys.argv)
+    failed = [result for result in report["interfaces"] if result["status"] != "success"]
+    print(f"Start-up finished in {report['seconds']}s, {len(report['interfaces']) - len(failed)} interfaces up, {len(failed)} failed.")
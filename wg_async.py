@@ -0,0 +1,91 @@
+import asyncio
+import fcntl
+import logging
+import os
+from contextlib import asynccontextmanager
+
+import jobs
+
+logger = logging.getLogger(__name__)
+
+# asyncio counterparts of the wg-quick helpers in wg_mgmt, for the ASGI server
+# (asgi.py). They return the same result dicts so callers can treat both alike.
+command_timeout = float(os.environ.get('WG_COMMAND_TIMEOUT', '30'))
+
+lock_poll_interval = 0.05
+
+
+@asynccontextmanager
+async def target_lock(target):
+    """The per-target flock of jobs.target_lock, polled so waiting never blocks the event loop."""
+    with open(jobs.lock_path(target), 'a') as lock_file:
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(lock_poll_interval)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+async def run_command(command, timeout=None, input=None):
+    """Run command without blocking the event loop; returns (returncode, stdout, stderr).
+
+    Raises asyncio.TimeoutError after killing the process if it overruns timeout.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(
+            process.communicate(input.encode() if input is not None else None), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+    return process.returncode, stdout.decode('utf-8', 'replace'), stderr.decode('utf-8', 'replace')
+
+
+async def bring_interface_up(interface_name, timeout=None):
+    timeout = timeout or command_timeout
+    command = ['wg-quick', 'up', interface_name.replace('.conf', '')]
+    try:
+        returncode, stdout, stderr = await run_command(command, timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"{' '.join(command)} timed out after {timeout}s")
+        return {"status": "error", "error_code": 124, "error_message": f"Timed out after {timeout}s"}
+    except Exception as e:
+        logger.error(f"An error occurred: {e}")
+        return {"status": "error", "error_code": 3, "error_message": str(e)}
+
+    if returncode != 0:
+        logger.error(f"Subprocess failed with error code {returncode}: {stderr}")
+        return {"status": "error", "error_code": returncode, "error_message": stderr}
+    logger.info(f"Command executed successfully: {' '.join(command)}")
+    return {"status": "success", "output": stdout}
+
+async def bring_interface_down(interface_name, timeout=None):
+    timeout = timeout or command_timeout
+    command = ['wg-quick', 'down', interface_name.replace('.conf', '')]
+    try:
+        returncode, stdout, stderr = await run_command(command, timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"{' '.join(command)} timed out after {timeout}s")
+        return {"status": "error", "error_code": 124, "error_message": f"Timed out after {timeout}s"}
+    except Exception as e:
+        logger.error(f"An error occurred: {e}")
+        return {"status": "error", "error_code": 3, "error_message": str(e)}
+
+    if returncode == 0:
+        logger.info("wg-quick down completed successfully.")
+        return {"status": "success", "message": "Interface down successfully", "error_code": 0}
+    if returncode == 1:
+        logger.warning("Config already down or another error occurred.")
+        return {"status": "warning", "message": "Config may already be down", "error_code": 1}
+    logger.error(f"Error on wg-quick down: {stderr}")
+    return {"status": "error", "message": "Failed to bring interface down", "error_code": returncode, "error_message": stderr}
@@ -0,0 +1,186 @@
+import base64
+import binascii
+
+# Parsed once, edited by key, serialised once. Shared by the add, save and
+# live-apply paths in wg_mgmt instead of rescanning the text with regexes.
+
+# [Interface] keys that `wg syncconf` can change on a running interface;
+# anything else (Address, MTU, Table, Pre/PostUp...) is wg-quick's business
+# and needs a full down/up.
+LIVE_INTERFACE_KEYS = frozenset({'privatekey', 'listenport', 'fwmark'})
+
+KNOWN_SECTIONS = ('Interface', 'Peer')
+
+
+class Section:
+    __slots__ = ('name', 'entries')
+
+    def __init__(self, name):
+        self.name = name
+        # [key, value, inline comment] in file order; comment lines are stored as [None, text, '']
+        self.entries = []
+
+    def get(self, key, default=None):
+        key = key.lower()
+        for entry_key, value, _ in self.entries:
+            if entry_key is not None and entry_key.lower() == key:
+                return value
+        return default
+
+    def get_all(self, key):
+        key = key.lower()
+        return [value for entry_key, value, _ in self.entries if entry_key is not None and entry_key.lower() == key]
+
+    def has(self, key):
+        return self.get(key) is not None
+
+    def set(self, key, value):
+        # Replace the first occurrence and drop any duplicates, or append
+        lowered = key.lower()
+        entries = []
+        replaced = False
+        for entry in self.entries:
+            if entry[0] is not None and entry[0].lower() == lowered:
+                if not replaced:
+                    entries.append([entry[0], value, entry[2]])
+                    replaced = True
+                continue
+            entries.append(entry)
+        if not replaced:
+            entries.append([key, value, ''])
+        self.entries = entries
+
+    def add(self, key, value):
+        self.entries.append([key, value, ''])
+
+    def remove(self, key):
+        lowered = key.lower()
+        before = len(self.entries)
+        self.entries = [entry for entry in self.entries if entry[0] is None or entry[0].lower() != lowered]
+        return before - len(self.entries)
+
+    def settings(self, exclude=()):
+        # Comparable view: lower-cased key -> list of values
+        result = {}
+        for key, value, _ in self.entries:
+            if key is not None and key.lower() not in exclude:
+                result.setdefault(key.lower(), []).append(value)
+        return result
+
+    def lines(self):
+        yield f"[{self.name}]"
+        for key, value, comment in self.entries:
+            if key is None:
+                yield value
+            else:
+                yield f"{key} = {value} {comment}" if comment else f"{key} = {value}"
+
+
+class WireGuardConfig:
+    __slots__ = ('preamble', 'interface', 'peers', 'extra')
+
+    def __init__(self):
+        self.preamble = []  # comments before the first section
+        self.interface = None
+        self.peers = []
+        self.extra = []  # unknown sections, kept so nothing is silently lost
+
+    @classmethod
+    def parse(cls, text):
+        # Forms and JSON can deliver literal "\n" sequences; normalise them once here
+        text = text.replace('\\n', '\n').replace('\r\n', '\n')
+        config = cls()
+        current = None
+        for raw_line in text.split('\n'):
+            line = raw_line.strip()
+            if not line:
+                continue
+            if line.startswith('[') and line.endswith(']'):
+                name = line[1:-1].strip()
+                current = Section(name.capitalize() if name.lower() in ('interface', 'peer') else name)
+                if current.name == 'Interface' and config.interface is None:
+                    config.interface = current
+                elif current.name == 'Peer':
+                    config.peers.append(current)
+                else:
+                    config.extra.append(current)
+                continue
+            if line.startswith('#') or '=' not in line:
+                if current is None:
+                    config.preamble.append(line)
+                else:
+                    current.entries.append([None, line, ''])
+                continue
+            key, value = line.split('=', 1)
+            # Like wg-quick, everything after '#' is a comment; it is kept for serialisation
+            value, hash_sign, comment = value.partition('#')
+            if current is None:
+                config.preamble.append(line)
+            else:
+                current.entries.append([key.strip(), value.strip(), hash_sign + comment.rstrip()])
+        return config
+
+    def sections(self):
+        if self.interface is not None:
+            yield self.interface
+        yield from self.peers
+        yield from self.extra
+
+    def serialize(self):
+        blocks = []
+        if self.preamble:
+            blocks.append('\n'.join(self.preamble))
+        for section in self.sections():
+            blocks.append('\n'.join(section.lines()))
+        return '\n\n'.join(blocks) + '\n'
+
+    def normalize(self):
+        """Strip DNS (no resolvconf in the container) and add Table=off so the
+        tunnel never replaces the default route."""
+        if self.interface is None:
+            return self
+        self.interface.remove('DNS')
+        if (self.interface.get('Table') or '').lower() != 'off':
+            self.interface.set('Table', 'off')
+        return self
+
+    def validate(self):
+        errors = []
+        if self.interface is None:
+            return ["Missing [Interface] section."]
+        private_key = self.interface.get('PrivateKey')
+        if private_key is None:
+            errors.append("[Interface] is missing PrivateKey.")
+        elif not is_valid_key(private_key):
+            errors.append("[Interface] PrivateKey is not a valid WireGuard key.")
+        listen_port = self.interface.get('ListenPort')
+        if listen_port is not None and not (listen_port.isdigit() and 0 <= int(listen_port) <= 65535):
+            errors.append("[Interface] ListenPort must be a number between 0 and 65535.")
+        for index, peer in enumerate(self.peers, start=1):
+            public_key = peer.get('PublicKey')
+            if public_key is None:
+                errors.append(f"[Peer] #{index} is missing PublicKey.")
+            elif not is_valid_key(public_key):
+                errors.append(f"[Peer] #{index} PublicKey is not a valid WireGuard key.")
+        for section in self.extra:
+            errors.append(f"Unknown section [{section.name}].")
+        return errors
+
+    def requires_restart(self, other):
+        # True when going from self to other needs wg-quick down/up
+        if self.interface is None or other.interface is None:
+            return True
+        return self.interface.settings(LIVE_INTERFACE_KEYS) != other.interface.settings(LIVE_INTERFACE_KEYS)
+
+
+def is_valid_key(key):
+    try:
+        return len(base64.b64decode(key, validate=True)) == 32
+    except (binascii.Error, ValueError):
+        return False
+
+def parse(text):
+    return WireGuardConfig.parse(text)
+
+def normalize_config(text):
+    return WireGuardConfig.parse(text).normalize().serialize()
@@ -0,0 +1,255 @@
+import fcntl
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import time
+
+import gost_config
+import gost_mgmt
+import gost_plan
+import gost_pool
+import gost_supervisor
+import wg_mgmt
+
+logger = logging.getLogger(__name__)
+
+# Background health checker, run as its own process (`python3 wg_health.py`,
+# started from entrypoint.sh). Every interval it looks at each active wgN: the
+# newest peer handshake must be younger than max_handshake_age and, when
+# WG_HEALTH_PROBE=host:port is set, a TCP connect to that target through the
+# tunnel must succeed. WireGuard only handshakes while it has something to
+# send, so without a probe a missing or stale handshake only counts when the
+# tunnel is expected to handshake: a peer has PersistentKeepalive set or
+# traffic went through since the previous check. An idle tunnel is healthy.
+# An interface is only marked unhealthy after
+# fail_after failed checks in a row and healthy again after recover_after
+# good ones, so one lost probe does not move traffic back and forth.
+#
+# When an interface turns unhealthy its pooled listeners move to the healthy
+# interfaces of their pool (the least loaded first) and the rest fail over to
+# its standby interface; the standby listeners come back once it recovers.
+interval = float(os.environ.get('WG_HEALTH_INTERVAL', '10'))
+# WireGuard re-handshakes every two minutes while traffic flows
+max_handshake_age = float(os.environ.get('WG_HEALTH_MAX_HANDSHAKE_AGE', '180'))
+probe_target = os.environ.get('WG_HEALTH_PROBE', '')
+probe_timeout = float(os.environ.get('WG_HEALTH_PROBE_TIMEOUT', '3'))
+fail_after = int(os.environ.get('WG_HEALTH_FAIL_AFTER', '3'))
+recover_after = int(os.environ.get('WG_HEALTH_RECOVER_AFTER', '3'))
+state_path = os.environ.get('WG_HEALTH_STATE', 'wg_health.json')
+
+
+def probe(interface_name, target=None, timeout=None):
+    """TCP connect to host:port with the socket bound to interface_name.
+
+    Returns None on success, otherwise the error message.
+    """
+    host, _, port = (target or probe_target).rpartition(':')
+    try:
+        family, kind, proto, _, address = socket.getaddrinfo(host.strip('[]'), int(port), type=socket.SOCK_STREAM)[0]
+        with socket.socket(family, kind, proto) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, interface_name.encode())
+            sock.settimeout(timeout or probe_timeout)
+            sock.connect(address)
+    except (OSError, ValueError) as e:
+        return str(e) or type(e).__name__
+    return None
+
+def transfer(interface):
+    # Bytes through all peers; it only moves when the tunnel carries traffic
+    return sum(peer["rx_bytes"] + peer["tx_bytes"] for peer in interface["peers"])
+
+def check_interface(interface_name, interface, now=None, previous_transfer=None):
+    # One check of an interface from `wg show all dump`: (ok, handshake age, reason)
+    now = now if now is not None else time.time()
+    handshakes = [peer["latest_handshake"] for peer in interface["peers"] if peer["latest_handshake"]]
+    age = int(now - max(handshakes)) if handshakes else None
+    if probe_target:
+        # The probe's own packets make WireGuard handshake, so it alone decides
+        error = probe(interface_name)
+        if error is not None:
+            return False, age, f"Probe to {probe_target} failed: {error}"
+        return True, age, None
+    keepalive = any(peer["persistent_keepalive"] for peer in interface["peers"])
+    active = previous_transfer is not None and transfer(interface) != previous_transfer
+    if not keepalive and not active:
+        return True, age, None
+    if age is None:
+        return False, None, "No handshake yet"
+    if age > max_handshake_age:
+        return False, age, f"Last handshake {age}s ago"
+    return True, age, None
+
+def next_state(previous, ok, age, reason, now):
+    """Apply one check result to an interface's state, with hysteresis."""
+    state = dict(previous or {"healthy": True, "failures": 0, "successes": 0, "since": now})
+    if ok:
+        state["successes"] += 1
+        state["failures"] = 0
+    else:
+        state["failures"] += 1
+        state["successes"] = 0
+    if state["healthy"] and state["failures"] >= fail_after:
+        state["healthy"] = False
+        state["since"] = now
+    elif not state["healthy"] and state["successes"] >= recover_after:
+        state["healthy"] = True
+        state["since"] = now
+    state.update(handshake_age=age, reason=reason, checked=now)
+    return state
+
+
+def read_state(path=None):
+    try:
+        with open(path or state_path) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {"updated": None, "interfaces": {}}
+
+def write_state(state, path=None):
+    path = path or state_path
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.wg_health.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump(state, file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def interface_pools():
+    # pool name -> member interfaces, from the store's interface metadata
+    pools = {}
+    for name, metadata in gost_mgmt.store.all_interface_metadata().items():
+        if metadata.get('pool'):
+            pools.setdefault(metadata['pool'], []).append(name)
+    return {pool: sorted(members) for pool, members in pools.items()}
+
+def set_interface_pool(interface_name, pool):
+    return gost_mgmt.store.update_interface_metadata(interface_name, {'pool': pool or None})
+
+
+def move_pooled_listeners(interface_name, healthy, pools):
+    """Spread the pooled listeners on interface_name over their pools' healthy members.
+
+    Listeners whose pool has no healthy member stay where they are. Returns
+    the number of listeners moved.
+    """
+    load = {}
+    moves = {}  # target interface -> ports
+    for row in gost_mgmt.store.rows_for_interface(interface_name):
+        members = [name for name in pools.get(row.get('pool') or '', ()) if name in healthy and name != interface_name]
+        if not members:
+            continue
+        for name in members:
+            if name not in load:
+                load[name] = len(gost_mgmt.store.listener_ids(name))
+        target = min(members, key=lambda name: load[name])
+        load[target] += 1
+        moves.setdefault(target, set()).add(row['port'])
+    moved = 0
+    for target, ports in moves.items():
+        moved += gost_mgmt.store.replace_interface(interface_name, target, ports=ports)
+        logger.info(f"Moved {len(ports)} pooled listeners from unhealthy {interface_name} to {target}")
+    return moved
+
+def reload_gost():
+    # config/pool mode reload in place; a single command line has to be restarted with the new egress
+    if gost_config.gost_mode == 'pool':
+        gost_pool.sync_shards()
+    elif gost_config.gost_mode == 'config':
+        gost_config.sync_config()
+    else:
+        gost_plan.plan.current()
+        if gost_supervisor.gost_status()["status"] == "success":
+            logger.warning("Restarting GOST to apply the moved listeners; this drops every open connection")
+            gost_supervisor.start_gost()
+
+
+class HealthChecker:
+    def __init__(self):
+        self.state = read_state().get("interfaces", {})
+
+    def check(self, now=None):
+        """Run one round of checks, move listeners off interfaces that turned unhealthy.
+
+        Returns the names of the interfaces whose health changed.
+        """
+        now = now if now is not None else time.time()
+        dump = wg_mgmt.get_wireguard_dump()
+        previous = self.state
+        state = {}
+        for name, interface in dump.items():
+            ok, age, reason = check_interface(name, interface, now, previous.get(name, {}).get("transfer"))
+            state[name] = dict(next_state(previous.get(name), ok, age, reason, now), transfer=transfer(interface))
+        for name, entry in previous.items():
+            if name in dump or not os.path.exists(os.path.join(wg_mgmt.wg_config_path, f"{name}.conf")):
+                continue
+            # Brought down: it carries no traffic, so no need to wait for more checks
+            state[name] = dict(entry, healthy=False, failures=max(entry["failures"], fail_after), successes=0,
+                               since=now if entry["healthy"] else entry["since"],
+                               handshake_age=None, reason="Interface is down", checked=now)
+        self.state = state
+
+        changed = [name for name, entry in state.items()
+                   if entry["healthy"] != previous.get(name, {}).get("healthy", True)]
+        healthy = {name for name, entry in state.items() if entry["healthy"]}
+        pools = interface_pools()
+        moved = 0
+        for name, entry in state.items():
+            if not entry["healthy"]:
+                # Every round, so listeners stuck because their pool had no healthy member move once one recovers
+                moved += move_pooled_listeners(name, healthy, pools)
+        for name in changed:
+            if state[name]["healthy"]:
+                moved += wg_mgmt.restore_listeners(name)
+            else:
+                moved += wg_mgmt.fail_over_listeners(name)
+            if state[name]["healthy"]:
+                logger.info(f"{name} is healthy again")
+            else:
+                logger.warning(f"{name} is unhealthy: {state[name]['reason']}")
+        if moved:
+            reload_gost()
+
+        write_state({"updated": now, "interfaces": state})
+        return changed
+
+    def run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Health check failed: {e}")
+            time.sleep(max(interval - (time.monotonic() - started), 0))
+
+
+def main():
+    if interval <= 0:
+        print("WG_HEALTH_INTERVAL is 0, health checks are disabled.")
+        return
+    # One checker per container, however often this is started
+    lock_file = open(f"{state_path}.lock", 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print("The WireGuard health checker is already running.")
+        return
+    HealthChecker().run()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    if sys.argv[1:2] == ['once']:
+        checker = HealthChecker()
+        checker.check()
+        print(json.dumps(checker.state, indent=2))
+    else:
+        main()
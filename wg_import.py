@@ -0,0 +1,121 @@
+import os
+import posixpath
+import tarfile
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import wg_mgmt
+
+# Provider exports (Mullvad, AirVPN, ...) come as zip or tar archives of
+# hundreds of .conf files. Entries are size-capped so a hostile archive
+# cannot exhaust memory.
+max_entry_size = 64 * 1024
+max_entries = 5000
+max_archive_size = int(os.environ.get('WG_IMPORT_MAX_ARCHIVE', str(64 * 1024 * 1024)))
+spool_memory = 8 * 1024 * 1024
+max_parallel = int(os.environ.get('WG_IMPORT_PARALLELISM', '8'))
+bring_up_timeout = float(os.environ.get('WG_STARTUP_TIMEOUT', '30'))
+
+
+def spool(stream):
+    """Copy a non-seekable request body to a seekable file (memory first, disk past 8 MiB)."""
+    spooled = tempfile.SpooledTemporaryFile(max_size=spool_memory)
+    copied = 0
+    while True:
+        chunk = stream.read(64 * 1024)
+        if not chunk:
+            break
+        copied += len(chunk)
+        if copied > max_archive_size:
+            spooled.close()
+            raise ValueError("Archive is too large.")
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled
+
+def _is_config_name(name):
+    base = posixpath.basename(name)
+    return base.endswith('.conf') and not base.startswith('.')
+
+def iter_archive_entries(fileobj):
+    """Yield (entry name, text or None, error or None) for each .conf in a zip or tar."""
+    count = 0
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not _is_config_name(info.filename):
+                    continue
+                count += 1
+                if count > max_entries:
+                    raise ValueError(f"Archive has more than {max_entries} configs.")
+                if info.file_size > max_entry_size:
+                    yield info.filename, None, "Config file is too large."
+                    continue
+                try:
+                    yield info.filename, archive.read(info).decode('utf-8'), None
+                except (UnicodeDecodeError, zipfile.BadZipFile, RuntimeError) as e:
+                    yield info.filename, None, f"Could not read entry: {e}"
+        return
+
+    fileobj.seek(0)
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode='r:*')
+    except tarfile.TarError:
+        raise ValueError("Upload is not a zip or tar archive.")
+    with archive:
+        for member in archive:
+            if not member.isfile() or not _is_config_name(member.name):
+                continue
+            count += 1
+            if count > max_entries:
+                raise ValueError(f"Archive has more than {max_entries} configs.")
+            if member.size > max_entry_size:
+                yield member.name, None, "Config file is too large."
+                continue
+            try:
+                yield member.name, archive.extractfile(member).read().decode('utf-8'), None
+            except (UnicodeDecodeError, tarfile.TarError) as e:
+                yield member.name, None, f"Could not read entry: {e}"
+
+
+def bring_up_all(interface_names, parallelism=None, timeout=None):
+    def bring_up(interface_name):
+        started = time.monotonic()
+        result = wg_mgmt.bring_interface_up(interface_name, timeout=timeout or bring_up_timeout)
+        return dict(result, seconds=round(time.monotonic() - started, 3))
+
+    with ThreadPoolExecutor(max_workers=max(1, parallelism or max_parallel)) as pool:
+        return dict(zip(interface_names, pool.map(bring_up, interface_names)))
+
+def import_archive(fileobj, bring_up=False, parallelism=None):
+    """Normalise, allocate and write every config in the archive; returns a per-file report."""
+    report = []
+    texts = []
+    for name, text, error in iter_archive_entries(fileobj):
+        entry = {"file": name, "status": "error" if error else "pending", "interface": None, "message": error}
+        report.append(entry)
+        if text is not None:
+            texts.append((entry, text))
+
+    # One allocator call and one pass of writes for the whole archive
+    results = wg_mgmt.add_wireguard_configs([text for _, text in texts])
+    for (entry, _), result in zip(texts, results):
+        entry["status"] = result["status"]
+        entry["interface"] = result.get("interface")
+        entry["message"] = None if result["status"] == "success" else result["message"]
+
+    if bring_up:
+        added = [entry["interface"] for entry in report if entry["status"] == "success"]
+        up_results = bring_up_all(added, parallelism)
+        for entry in report:
+            result = up_results.get(entry["interface"])
+            if result is not None:
+                entry["up"] = {
+                    "status": result["status"],
+                    "seconds": result["seconds"],
+                    "error": result.get("error_message")
+                }
+    return report
@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+
+import profiling
+import wg_mgmt
+
+sysfs_net_path = '/sys/class/net'
+# How long the set of up interfaces is trusted before sysfs is checked again;
+# changes made through this process invalidate it immediately.
+active_ttl = float(os.environ.get('WG_INVENTORY_TTL', '2'))
+
+
+def interface_sort_key(name):
+    # wg2 before wg10
+    digits = name[2:]
+    return (0, int(digits)) if name.startswith('wg') and digits.isdigit() else (1, name)
+
+
+class WireGuardInventory:
+    """Cached view of the configured (/etc/wireguard) and live WireGuard interfaces.
+
+    The config listing is only rescanned when the directory's mtime changes.
+    The live set is read from sysfs (DEVTYPE=wireguard in each device's
+    uevent), so a warm or refreshed cache never forks `wg`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._config_names = []
+        self._config_signature = None
+        self._active = []
+        self._active_at = None
+
+    def _directory_signature(self):
+        try:
+            st = os.stat(wg_mgmt.wg_config_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns)
+
+    def config_names(self):
+        with self._lock:
+            signature = self._directory_signature()
+            if signature is None or signature != self._config_signature:
+                names = wg_mgmt.get_wireguard_interface_names()
+                self._config_names = sorted(names, key=interface_sort_key)
+                self._config_signature = signature
+            return list(self._config_names)
+
+    def _read_active(self):
+        try:
+            names = os.listdir(sysfs_net_path)
+        except OSError:
+            return wg_mgmt.get_active_wireguard_interfaces()
+        active = []
+        for name in names:
+            try:
+                with open(os.path.join(sysfs_net_path, name, 'uevent')) as uevent:
+                    if 'DEVTYPE=wireguard' in uevent.read():
+                        active.append(name)
+            except OSError:
+                continue
+        return active
+
+    def active_interfaces(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._active_at is None or now - self._active_at >= active_ttl:
+                with profiling.span('file', f"scan {sysfs_net_path}"):
+                    self._active = sorted(self._read_active(), key=interface_sort_key)
+                self._active_at = now
+            return list(self._active)
+
+    def invalidate(self):
+        # Call after bringing interfaces up/down or adding/removing configs
+        with self._lock:
+            self._active_at = None
+            self._config_signature = None
+
+    def snapshot(self):
+        active = set(self.active_interfaces())
+        return [{"name": name, "active": name in active} for name in self.config_names()]
+
+
+inventory = WireGuardInventory()
@@ -1,70 +1,133 @@
 import os
 import re
+import fcntl
 import subprocess
 import  logging
-import csv
+import gost_mgmt
+import profiling
+import wg_config
 
 logger = logging.getLogger(__name__)
 
 wg_config_path = '/etc/wireguard'
+# Where listeners go when their interface is removed and it has no standby
+fallback_interface = os.environ.get('WG_FALLBACK_INTERFACE', 'lo')
 
 def get_wireguard_interfaces():
     try:
-        wg_output = os.popen('wg').read()
+        with profiling.span('subprocess', 'wg'):
+            wg_output = os.popen('wg').read()
     except Exception as e:
         print(f"An error occurred: {e}")
         return {"status": "error", "message": f"{e}"}
     interfaces = re.findall(r'interface: (\S+)', wg_output)
     return interfaces
 
-def add_wireguard_config(wireguard_config):
-    # Normalize line endings and escape characters
-    wireguard_config = wireguard_config.replace('\\n', '\n').replace('\n', os.linesep)
-    wireguard_config = remove_dns_from_interface_section(wireguard_config)
-    wireguard_config = add_table_off_to_interface_section(wireguard_config)
-
-    # Get a list of existing WireGuard config files
-    try:
-        existing_configs = os.listdir(wg_config_path)
-    except FileNotFoundError:
-        print("The directory does not exist. Make sure you have WireGuard installed and the correct path is set.")
-        return {"status": "error", "message": "Directory does not exist"}
+# Next free wgN number, persisted so adds don't have to list /etc/wireguard
+allocator_counter_file = '.wg_next'
+allocator_lock_file = '.wg_alloc.lock'
 
-    # Pattern to match the files in the format 'wgX.conf'
+def _highest_config_number():
     pattern = re.compile(r'wg(\d+)\.conf$')
-
-    # Find the highest number (X) used in the existing config files
     highest_number = 0
-    for config in existing_configs:
-        match = pattern.match(config)
+    for name in os.listdir(wg_config_path):
+        match = pattern.match(name)
         if match:
-            number = int(match.group(1))
-            highest_number = max(highest_number, number)
-
-    # Set the new config file name to one number higher than the highest found
-    new_config_file = f"wg{highest_number + 1}.conf"
-
-    # Path for the new config file
-    new_config_path = os.path.join(wg_config_path, new_config_file)
-
-    # Check if the new config file already exists by some other means
-    if os.path.exists(new_config_path):
-        print(f"The file {new_config_file} already exists. Incrementing to a higher number.")
-        # If for some reason it exists, increment until we find a free number
-        highest_number += 1
-        new_config_file = f"wg{highest_number + 1}.conf"
-        new_config_path = os.path.join(wg_config_path, new_config_file)
+            highest_number = max(highest_number, int(match.group(1)))
+    return highest_number
+
+def reserve_interface_names(count=1):
+    """Reserve `count` new wgN names by creating their (empty) config files.
+
+    Files are created with O_CREAT|O_EXCL, so a name can never be handed out
+    twice or clobber an existing config, even across gunicorn workers. The
+    counter is only a starting hint: taken numbers are skipped. The directory
+    is scanned once to seed the counter if it is missing.
+    """
+    counter_path = os.path.join(wg_config_path, allocator_counter_file)
+    with profiling.span('file', f"reserve {count} interface names"), \
+            open(os.path.join(wg_config_path, allocator_lock_file), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            try:
+                with open(counter_path) as file:
+                    number = int(file.read().strip())
+            except (FileNotFoundError, ValueError):
+                number = _highest_config_number() + 1
+
+            names = []
+            while len(names) < count:
+                name = f"wg{number}"
+                number += 1
+                try:
+                    fd = os.open(os.path.join(wg_config_path, f"{name}.conf"), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+                except FileExistsError:
+                    continue
+                os.close(fd)
+                names.append(name)
+
+            tmp_path = f"{counter_path}.tmp"
+            with open(tmp_path, 'w') as file:
+                file.write(str(number))
+            os.replace(tmp_path, counter_path)
+            return names
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def release_interface_name(interface_name):
+    # Undo a reservation whose config could not be written
+    try:
+        os.remove(os.path.join(wg_config_path, f"{interface_name}.conf"))
+    except FileNotFoundError:
+        pass
 
-    # Write the WireGuard configuration to the new config file
+def write_reserved_config(interface_name, wireguard_config):
+    new_config_path = os.path.join(wg_config_path, f"{interface_name}.conf")
     try:
-        with open(new_config_path, 'w') as config_file:
+        with profiling.span('file', f"write {new_config_path}"), open(new_config_path, 'w') as config_file:
             config_file.write(wireguard_config)
-    except IOError as e:
-        print(f"An error occurred while writing to the file: {e}")
-        return {"status": "error", "message": f"Failed to write configuration"}
     except Exception as e:
+        print(f"An error occurred while writing to the file: {e}")
+        release_interface_name(interface_name)
         return {"status": "error", "message": f"Failed to write configuration because {e}"}
-    return {"status": "success", "message": "Configuration saved and interface updated"}
+    return {"status": "success", "message": "Configuration saved and interface updated", "interface": interface_name}
+
+def add_wireguard_config(wireguard_config):
+    # Parse once: drop DNS, add Table=off and check the keys before writing anything
+    config = wg_config.parse(wireguard_config).normalize()
+    errors = config.validate()
+    if errors:
+        return {"status": "error", "message": " ".join(errors)}
+
+    try:
+        interface_name = reserve_interface_names(1)[0]
+    except FileNotFoundError:
+        print("The directory does not exist. Make sure you have WireGuard installed and the correct path is set.")
+        return {"status": "error", "message": "Directory does not exist"}
+
+    return write_reserved_config(interface_name, config.serialize())
+
+def add_wireguard_configs(wireguard_configs):
+    """Add many configs with a single allocation; returns one result per input, in order."""
+    results = []
+    valid = []
+    for index, wireguard_config in enumerate(wireguard_configs):
+        config = wg_config.parse(wireguard_config).normalize()
+        errors = config.validate()
+        if errors:
+            results.append({"status": "error", "message": " ".join(errors)})
+        else:
+            results.append(None)
+            valid.append((index, config.serialize()))
+
+    if valid:
+        try:
+            names = reserve_interface_names(len(valid))
+        except FileNotFoundError:
+            return [result or {"status": "error", "message": "Directory does not exist"} for result in results]
+        for (index, serialized), interface_name in zip(valid, names):
+            results[index] = write_reserved_config(interface_name, serialized)
+    return results
 
 
 def get_wireguard_interface_names():
@@ -75,7 +138,7 @@ def get_wireguard_interface_names():
         if not os.path.exists(wg_config_path):
             raise FileNotFoundError(f"The directory {wg_config_path} does not exist.")
 
-        with os.scandir(wg_config_path) as entries:
+        with profiling.span('file', f"list {wg_config_path}"), os.scandir(wg_config_path) as entries:
             for entry in entries:
                 if entry.is_file() and pattern.match(entry.name):
                     name_without_extension, _ = os.path.splitext(entry.name)
@@ -92,43 +155,7 @@ def get_wireguard_interface_names():
         logger.error(f"An unexpected error occurred: {e}")
         raise
 
-#to avoid changing default route
-def add_table_off_to_interface_section(wireguard_config):
-    wireguard_config = wireguard_config.replace('\\n', '\n').replace('\n', os.linesep)
-    
-    # Define the regex pattern for the [Interface] section and capturing the content after it
-    interface_section_pattern = r'(\[Interface\][^[]*)(\[Peer\]|\Z)'
-    # Search for the [Interface] section and the start of the [Peer] section or end of the string
-    match = re.search(interface_section_pattern, wireguard_config, re.DOTALL)
-
-    if match and 'Table=off' not in match.group(1):
-        # Construct the replacement string with "Table=off" and a newline
-        replacement = match.group(1).rstrip() + '\nTable=off\n\n' + match.group(2)
-        # Replace the matched text with the new string
-        wireguard_config = wireguard_config[:match.start(1)] + replacement + wireguard_config[match.end(2):]
-    print(wireguard_config)
-    return wireguard_config
-
-def remove_dns_from_interface_section(wireguard_config):
-    # Define the regex pattern for the [Interface] section and capturing the content after it
-    interface_section_pattern = r'(\[Interface\][^[]*)(\[Peer\]|\Z)'
-    # Search for the [Interface] section and the start of the [Peer] section or end of the string
-    match = re.search(interface_section_pattern, wireguard_config, re.DOTALL)
-
-    if match:
-        # Remove DNS settings from the [Interface] section if present
-        interface_section = match.group(1)
-        interface_section = re.sub(r'DNS\s*=\s*[^\\n]+', '', interface_section)
-
-        # Construct the replacement string
-        replacement = interface_section.rstrip() + '\n\n' + match.group(2)
-
-        # Replace the matched text with the new string
-        wireguard_config = wireguard_config[:match.start(1)] + replacement + wireguard_config[match.end(2):]
-
-    return wireguard_config
-
-def bring_interface_up(new_config_file):
+def bring_interface_up(new_config_file, timeout=None):
     # Remove the '.conf' extension from the config file name
     interface_name = new_config_file.replace('.conf', '')
 
@@ -136,17 +163,21 @@ def bring_interface_up(new_config_file):
     command = ['wg-quick', 'up', interface_name]
 
     try:
-        result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        with profiling.span('subprocess', ' '.join(command)):
+            result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout)
         logger.info(f"Command executed successfully: {' '.join(command)}")
         return {"status": "success", "output": result.stdout}
     except subprocess.CalledProcessError as e:
         logger.error(f"Subprocess failed with error code {e.returncode}: {e.stderr}")
         return {"status": "error", "error_code": e.returncode, "error_message": e.stderr}
+    except subprocess.TimeoutExpired:
+        logger.error(f"{' '.join(command)} timed out after {timeout}s")
+        return {"status": "error", "error_code": 124, "error_message": f"Timed out after {timeout}s"}
     except Exception as e:
         logger.error(f"An error occurred: {e}")
         return {"status": "error", "error_code": 3, "error_message": str(e)} 
 
-def bring_interface_down(new_config_file):
+def bring_interface_down(new_config_file, timeout=None):
     print(new_config_file)
     try:
         # Remove the '.conf' extension from the config file name
@@ -157,7 +188,8 @@ def bring_interface_down(new_config_file):
     command = ['wg-quick', 'down', interface_name]
 
     try:
-        p = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        with profiling.span('subprocess', ' '.join(command)):
+            p = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout)
 
         if p.returncode == 0:
             logger.info("wg-quick down completed successfully.")
@@ -172,6 +204,9 @@ def bring_interface_down(new_config_file):
     except subprocess.CalledProcessError as e:
         logger.error(f"Subprocess failed with error code {e.returncode}: {e.stderr}")
         return {"status": "error", "error_code": e.returncode, "error_message": e.stderr}
+    except subprocess.TimeoutExpired:
+        logger.error(f"{' '.join(command)} timed out after {timeout}s")
+        return {"status": "error", "error_code": 124, "error_message": f"Timed out after {timeout}s"}
     except FileNotFoundError as e:
         logger.error(f"Command not found: {e}")
         return {"status": "error", "error_code": 2, "error_message": str(e)}
@@ -180,34 +215,86 @@ def bring_interface_down(new_config_file):
         return {"status": "error", "error_code": 3, "error_message": str(e)}
 
 
+def wireguard_action(interface_name, action, timeout=None):
+    # Shared by the batch endpoint: 'up', 'down' or 'restart' one interface
+    if action == 'up':
+        return bring_interface_up(interface_name, timeout=timeout)
+    if action == 'down':
+        return bring_interface_down(interface_name, timeout=timeout)
+    if action == 'restart':
+        down = bring_interface_down(interface_name, timeout=timeout)
+        if down["status"] == "error":
+            return down
+        return bring_interface_up(interface_name, timeout=timeout)
+    return {"status": "error", "error_code": 3, "error_message": f"Unknown action: {action}"}
+
+
 def display_config(interface_name):
     config_file_path = os.path.join(wg_config_path, interface_name)
     
-    with open(config_file_path, 'r') as file:
+    with profiling.span('file', f"read {config_file_path}"), open(config_file_path, 'r') as file:
         config_data = file.read()
     return config_data
 
-def save_config(interface_name, new_config_data):
-    new_config_data = remove_dns_from_interface_section(new_config_data)
-    new_config_data = add_table_off_to_interface_section(new_config_data)
+def is_interface_up(interface_name):
+    return os.path.isdir(os.path.join('/sys/class/net', interface_name))
+
+def sync_interface_config(interface_name, timeout=None):
+    # Apply peers/keys to the running interface without tearing it down
+    try:
+        with profiling.span('subprocess', f"wg-quick strip {interface_name}"):
+            stripped = subprocess.run(['wg-quick', 'strip', interface_name], check=True,
+                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout)
+        with profiling.span('subprocess', f"wg syncconf {interface_name}"):
+            subprocess.run(['wg', 'syncconf', interface_name, '/dev/stdin'], check=True, input=stripped.stdout,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout)
+        logger.info(f"Applied configuration to {interface_name} with wg syncconf")
+        return {"status": "success", "output": ""}
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Live config sync of {interface_name} failed with error code {e.returncode}: {e.stderr}")
+        return {"status": "error", "error_code": e.returncode, "error_message": e.stderr}
+    except subprocess.TimeoutExpired as e:
+        logger.error(f"Live config sync of {interface_name} timed out after {timeout}s: {' '.join(e.cmd)}")
+        return {"status": "error", "error_code": 124, "error_message": f"Timed out after {timeout}s"}
+    except FileNotFoundError as e:
+        logger.error(f"Command not found: {e}")
+        return {"status": "error", "error_code": 2, "error_message": str(e)}
+
+def save_config(interface_name, new_config_data, timeout=None):
+    new_config = wg_config.parse(new_config_data).normalize()
+    errors = new_config.validate()
+    if errors:
+        return {"status": "error", "error_code": 3, "error_message": " ".join(errors), "mode": None}
 
     config_file_path = os.path.join(wg_config_path, f"{interface_name}.conf")
-    config_lines = new_config_data.split('\\n')
     try:
-        with open(config_file_path, 'w') as file:
-            for line in config_lines:
-                file.write(line + '\n')  # Append a newline character after each line
+        with profiling.span('file', f"read {config_file_path}"), open(config_file_path, 'r') as file:
+            old_config = wg_config.parse(file.read())
+    except FileNotFoundError:
+        old_config = None
+
+    try:
+        with profiling.span('file', f"write {config_file_path}"), open(config_file_path, 'w') as file:
+            file.write(new_config.serialize())
         print(f"Configuration saved to {config_file_path}")
     except IOError as e:
         print(f"Failed to write configuration to {config_file_path}: {e}")
 
-    bring_interface_down(interface_name)
-    bring_interface_up(interface_name)
+    # Peer and key edits are applied live; interface-level changes need wg-quick
+    if old_config is not None and is_interface_up(interface_name) \
+            and not old_config.requires_restart(new_config):
+        result = sync_interface_config(interface_name, timeout=timeout)
+        if result["status"] == "success":
+            return dict(result, mode="live")
+
+    bring_interface_down(interface_name, timeout=timeout)
+    return dict(bring_interface_up(interface_name, timeout=timeout), mode="restart")
 
 def get_active_wireguard_interfaces():
     try:
         # Run the 'wg' command and capture the output
-        wg_output = subprocess.check_output(['wg'], text=True)
+        with profiling.span('subprocess', 'wg'):
+            wg_output = subprocess.check_output(['wg'], text=True)
 
         # Regular expression to extract the interface names that are "up"
         interface_pattern = r'^interface: (\S+)'
@@ -220,8 +307,44 @@ def get_active_wireguard_interfaces():
         print(f"An unexpected error occurred: {e}")
     return []
 
+def parse_wireguard_dump(dump_output):
+    # `wg show all dump` prints one tab-separated line per interface
+    # (5 fields) followed by one line per peer (9 fields). Keys are never returned.
+    interfaces = {}
+    for line in dump_output.splitlines():
+        fields = line.split('\t')
+        if len(fields) == 5:
+            name, _private_key, public_key, listen_port, fwmark = fields
+            interfaces[name] = {
+                "public_key": public_key,
+                "listen_port": int(listen_port) if listen_port.isdigit() else None,
+                "fwmark": None if fwmark == 'off' else fwmark,
+                "peers": []
+            }
+        elif len(fields) == 9:
+            name, public_key, _preshared_key, endpoint, allowed_ips, handshake, rx, tx, keepalive = fields
+            interface = interfaces.setdefault(name, {"public_key": None, "listen_port": None, "fwmark": None, "peers": []})
+            interface["peers"].append({
+                "public_key": public_key,
+                "endpoint": None if endpoint == '(none)' else endpoint,
+                "allowed_ips": [] if allowed_ips == '(none)' else allowed_ips.split(','),
+                "latest_handshake": int(handshake),
+                "rx_bytes": int(rx),
+                "tx_bytes": int(tx),
+                "persistent_keepalive": None if keepalive == 'off' else int(keepalive)
+            })
+    return interfaces
+
+def get_wireguard_dump():
+    try:
+        with profiling.span('subprocess', 'wg show all dump'):
+            output = subprocess.check_output(['wg', 'show', 'all', 'dump'], text=True)
+    except subprocess.CalledProcessError as e:
+        logger.error(f"'wg show all dump' failed with error code {e.returncode}")
+        raise
+    return parse_wireguard_dump(output)
+
 def remove_wireguard_config(interface_name):
-    parameters_csv_path = "parameters.csv"
     config_file_path = os.path.join(wg_config_path, f"{interface_name}.conf")
     parameters_updated = False
 
@@ -233,32 +356,69 @@ def remove_wireguard_config(interface_name):
             logger.error(f"Failed to remove WireGuard config for interface: {interface_name}. Exception: {e}")
             return False
 
-        # Now, update the parameters.csv
+        # Now, update the listeners
         try:
-            # Read all data from the CSV
-            with open(parameters_csv_path, newline='') as csvfile:
-                reader = list(csv.DictReader(csvfile))
-
-            # Replace interface with 'lo' where the interface matches the one being removed
-            for row in reader:
-                if row['interface'] == interface_name:
-                    row['interface'] = 'lo'
-                    parameters_updated = True
-
-            # Write data back to CSV
-            with open(parameters_csv_path, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=reader[0].keys())
-                writer.writeheader()
-                writer.writerows(reader)
+            # Repoint only this interface's listeners: to its standby if it has one, else to 'lo'
+            target = standby_interface(interface_name) or fallback_interface
+            parameters_updated = gost_mgmt.store.replace_interface(interface_name, target) > 0
 
             if parameters_updated:
-                logger.info(f"WireGuard interface {interface_name} replaced with 'lo' in parameters.csv")
+                logger.info(f"WireGuard interface {interface_name} replaced with '{target}' in the listener store")
             else:
-                logger.warning(f"No matching interface found in parameters.csv to replace with 'lo'")
+                logger.warning(f"No listeners used {interface_name}; nothing to replace with '{target}'")
             return True
         except Exception as e:
             logger.error(f"Failed to update parameters.csv. Exception: {e}")
             return False
     else:
         logger.warning(f"No config file found for interface: {interface_name}. Nothing to remove.")
-        return False
\ No newline at end of file
+        return False
+
+
+# Cascades: the store's interface index lets these touch only the listeners
+# routed through one interface. Standby and failed-over ports are kept in the
+# store's interface metadata.
+
+def standby_interface(interface_name):
+    return gost_mgmt.store.interface_metadata(interface_name).get('standby')
+
+def set_standby_interface(interface_name, standby):
+    return gost_mgmt.store.update_interface_metadata(interface_name, {'standby': standby})
+
+def fail_over_listeners(interface_name):
+    """The interface went down: move its listeners to its standby, if it has one.
+
+    The moved ports are remembered with the interface they went to, so
+    restore_listeners() brings back exactly those, even if the standby is
+    changed in the meantime. Returns the number of listeners moved.
+    """
+    standby = standby_interface(interface_name)
+    if not standby:
+        return 0
+    ports = [row['port'] for row in gost_mgmt.store.rows_for_interface(interface_name)]
+    if not ports:
+        return 0
+    moved = gost_mgmt.store.replace_interface(interface_name, standby)
+    failed_over = dict(gost_mgmt.store.interface_metadata(interface_name).get('failed_over') or {})
+    failed_over[standby] = sorted(set(failed_over.get(standby, [])) | set(ports))
+    gost_mgmt.store.update_interface_metadata(interface_name, {'failed_over': failed_over})
+    logger.info(f"Moved {moved} listeners from {interface_name} to standby {standby}")
+    return moved
+
+def restore_listeners(interface_name):
+    # The interface is back up: return the listeners fail_over_listeners() moved away
+    failed_over = gost_mgmt.store.interface_metadata(interface_name).get('failed_over')
+    if not failed_over:
+        return 0
+    moved = 0
+    for target, ports in failed_over.items():
+        # Only the ones still there; listeners moved on by hand since then stay put
+        count = gost_mgmt.store.replace_interface(target, interface_name, ports=set(ports))
+        logger.info(f"Moved {count} listeners from standby {target} back to {interface_name}")
+        moved += count
+    gost_mgmt.store.update_interface_metadata(interface_name, {'failed_over': {}})
+    return moved
+
+def reassign_listeners(interface_name, new_interface):
+    # Replace the egress of every listener on interface_name
+    return gost_mgmt.store.replace_interface(interface_name, new_interface)
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import deque
+
+import wg_mgmt
+
+# Recent `wg show all dump` samples, used to turn the byte counters into rates
+max_samples = 120
+# Samples closer together than this reuse the previous dump
+min_interval = 1.0
+default_window = 60
+
+
+class WireGuardStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=max_samples)  # (monotonic time, wall time, dump)
+
+    def sample(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._samples and now - self._samples[-1][0] < min_interval:
+                return self._samples[-1]
+        dump = wg_mgmt.get_wireguard_dump()
+        entry = (time.monotonic(), time.time(), dump)
+        with self._lock:
+            self._samples.append(entry)
+        return entry
+
+    def _baseline(self, window):
+        # Oldest sample that is still inside the window, excluding the newest
+        with self._lock:
+            samples = list(self._samples)
+        if len(samples) < 2:
+            return None
+        newest = samples[-1][0]
+        for sample in samples[:-1]:
+            if newest - sample[0] <= window:
+                return sample
+        return samples[-2]
+
+    def stats(self, window=default_window):
+        current_mono, current_wall, dump = self.sample()
+        baseline = self._baseline(window)
+        previous = {}
+        elapsed = None
+        if baseline is not None:
+            elapsed = current_mono - baseline[0]
+            for name, interface in baseline[2].items():
+                for peer in interface["peers"]:
+                    previous[(name, peer["public_key"])] = (peer["rx_bytes"], peer["tx_bytes"])
+
+        result = {}
+        for name, interface in dump.items():
+            peers = []
+            total_rx = total_tx = 0
+            rx_rate_total = tx_rate_total = None
+            for peer in interface["peers"]:
+                peer = dict(peer)
+                handshake = peer["latest_handshake"]
+                peer["handshake_age"] = int(current_wall - handshake) if handshake else None
+                peer["rx_rate"] = peer["tx_rate"] = None
+                before = previous.get((name, peer["public_key"]))
+                if before is not None and elapsed:
+                    # Counters reset when the interface is recreated
+                    peer["rx_rate"] = max(peer["rx_bytes"] - before[0], 0) / elapsed
+                    peer["tx_rate"] = max(peer["tx_bytes"] - before[1], 0) / elapsed
+                    rx_rate_total = (rx_rate_total or 0) + peer["rx_rate"]
+                    tx_rate_total = (tx_rate_total or 0) + peer["tx_rate"]
+                total_rx += peer["rx_bytes"]
+                total_tx += peer["tx_bytes"]
+                peers.append(peer)
+            result[name] = {
+                "public_key": interface["public_key"],
+                "listen_port": interface["listen_port"],
+                "rx_bytes": total_rx,
+                "tx_bytes": total_tx,
+                "rx_rate": rx_rate_total,
+                "tx_rate": tx_rate_total,
+                "peers": peers
+            }
+        return {"interfaces": result, "window": round(elapsed, 3) if elapsed else None}
+
+
+collector = WireGuardStats()